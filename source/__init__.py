@@ -2,18 +2,38 @@
 This code gives us, amongst other things, the ability to import specific
 classes and functions from the package directly, rather than having to go
 through the modules in which they are defined.
+
+The modules in question are only imported when one of their names is first
+asked for, so that the console entry points - one of which runs every time a
+shell starts - don't pay for modules they never use.
 """
 
-# Local imports.
-from .continuous_integration import run_continuous_integration
-from .hm_software_installer import HMSoftwareInstaller, install_hmss
-from .install_dependencies import (
-    install_apt_package,
-    install_apt_packages,
-    install_dependencies,
-    install_dependency,
-)
-from .misc import get_yes_no
+# Standard imports.
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .continuous_integration import run_continuous_integration
+    from .hm_software_installer import HMSoftwareInstaller, install_hmss
+    from .install_dependencies import (
+        install_apt_package,
+        install_apt_packages,
+        install_dependencies,
+        install_dependency,
+    )
+    from .misc import get_yes_no
+
+# Local constants.
+LAZY_NAMES = {
+    "HMSoftwareInstaller": ".hm_software_installer",
+    "get_yes_no": ".misc",
+    "install_apt_package": ".install_dependencies",
+    "install_apt_packages": ".install_dependencies",
+    "install_dependencies": ".install_dependencies",
+    "install_dependency": ".install_dependencies",
+    "install_hmss": ".hm_software_installer",
+    "run_continuous_integration": ".continuous_integration",
+}
 
 __all__ = [
     "HMSoftwareInstaller",
@@ -25,3 +45,15 @@ __all__ = [
     "install_hmss",
     "run_continuous_integration",
 ]
+
+def __getattr__(name: str):
+    """ Import the module which defines a given public name, on demand. """
+    if name not in LAZY_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(LAZY_NAMES[name], __name__)
+    result = getattr(module, name)
+    globals()[name] = result
+    return result
+
+def __dir__() -> list[str]:
+    return sorted(set(globals())|set(__all__))
@@ -0,0 +1,155 @@
+"""
+This code defines a long-running process which backs up the royal repos
+periodically, and whenever it's asked to over a Unix socket, so that a new
+shell need only send it a message rather than run a backup of its own.
+"""
+
+# Standard imports.
+import socket
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+# Local imports.
+from .backup_state import backup_lock
+from .hmss_config import DEFAULT_BACKUP_DAEMON_INTERVAL
+
+if TYPE_CHECKING:
+    from .royal_repos_backup import RoyalReposBackup
+
+# Local constants.
+PATH_TO_BACKUP_SOCKET = str(Path.home()/"hm_git.sock")
+PATH_TO_DAEMON_LOCK = str(Path.home()/"hm_git_daemon.lock")
+SOCKET_TIMEOUT = 1.0  # In seconds.
+MAX_MESSAGE_LENGTH = 64
+# Messages.
+SYNC = b"sync"
+STOP = b"stop"
+OK = b"ok"
+UNKNOWN = b"unknown"
+
+##############
+# MAIN CLASS #
+##############
+
+def run_backup_daemon(*args, **kwargs) -> bool:
+    """
+    Ask the daemon to back up the royal repos, becoming the daemon if there
+    isn't one already.
+    """
+    if send_message(SYNC) == OK:
+        return True
+    # Only now do we need the backup engine; a ping shouldn't pay for it.
+    from .royal_repos_backup import RoyalReposBackup
+
+    backup_obj = RoyalReposBackup(*args, keep_state=True, **kwargs)
+    if not backup_obj.config:
+        return False
+    interval = \
+        backup_obj.config.backup_daemon_interval or \
+        DEFAULT_BACKUP_DAEMON_INTERVAL
+    daemon = BackupDaemon(backup_obj, interval=interval)
+    if not daemon.serve():
+        # Another daemon is just starting up, and will back up in any case.
+        backup_obj.logger.info("Another backup daemon is already running.")
+    return True
+
+@dataclass
+class BackupDaemon:
+    """ The class in question. """
+    backup: "RoyalReposBackup"
+    interval: float = DEFAULT_BACKUP_DAEMON_INTERVAL
+    syncs: int = field(init=False, default=0)
+    triggered: threading.Event = \
+        field(init=False, default_factory=threading.Event)
+    stopping: threading.Event = \
+        field(init=False, default_factory=threading.Event)
+
+    def _sync_loop(self):
+        """
+        Back up straight away, and then whenever triggered or whenever the
+        interval has passed. Any number of triggers which arrive during a
+        backup are coalesced into a single backup once it's done. A backup
+        which blows up is logged, and doesn't stop the next one.
+        """
+        while not self.stopping.is_set():
+            self.triggered.clear()
+            try:
+                self.backup.back_up_all()
+            except Exception:  # Log it; don't let the daemon go deaf.
+                self.backup.logger.exception("Backup failed unexpectedly.")
+            self.syncs += 1
+            self.triggered.wait(self.interval)
+
+    def _handle(self, connection: socket.socket):
+        """ Act upon, and reply to, a single message. """
+        with connection:
+            connection.settimeout(SOCKET_TIMEOUT)
+            try:
+                message = connection.recv(MAX_MESSAGE_LENGTH).strip()
+                if message == SYNC:
+                    self.triggered.set()
+                elif message == STOP:
+                    self.stop()
+                else:
+                    connection.sendall(UNKNOWN)
+                    return
+                connection.sendall(OK)
+            except OSError:
+                pass
+
+    def stop(self):
+        """ Ask the daemon to stop, once any backup underway has finished. """
+        self.stopping.set()
+        self.triggered.set()
+
+    def serve(self) -> bool:
+        """
+        Listen for messages until told to stop. Return False, straight away,
+        if another daemon is already doing so.
+        """
+        with backup_lock(PATH_TO_DAEMON_LOCK) as locked:
+            if not locked:
+                return False
+            Path(PATH_TO_BACKUP_SOCKET).unlink(missing_ok=True)
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+                server.bind(PATH_TO_BACKUP_SOCKET)
+                server.listen()
+                server.settimeout(SOCKET_TIMEOUT)
+                worker = threading.Thread(target=self._sync_loop, daemon=True)
+                worker.start()
+                try:
+                    while not self.stopping.is_set():
+                        try:
+                            connection, _ = server.accept()
+                        except TimeoutError:
+                            continue
+                        self._handle(connection)
+                finally:
+                    self.stop()
+                    worker.join()
+                    Path(PATH_TO_BACKUP_SOCKET).unlink(missing_ok=True)
+        return True
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def send_message(message: bytes) -> bytes|None:
+    """
+    Send a given message to the daemon, and return its reply, or None if
+    there's no daemon listening.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(SOCKET_TIMEOUT)
+            client.connect(PATH_TO_BACKUP_SOCKET)
+            client.sendall(message)
+            return client.recv(MAX_MESSAGE_LENGTH)
+    except OSError:
+        return None
+
+def stop_backup_daemon() -> bool:
+    """ Ronseal. Return whether there was a daemon to stop. """
+    return send_message(STOP) == OK
@@ -0,0 +1,91 @@
+"""
+This code defines a class which remembers when each royal repo was last backed
+up successfully, and a lock which stops two backups running at once.
+"""
+
+# Standard imports.
+import fcntl
+import json
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Self
+
+# Local constants.
+PATH_TO_BACKUP_STATE = str(Path.home()/"hm_git_state.json")
+PATH_TO_BACKUP_LOCK = str(Path.home()/"hm_git.lock")
+JSON_INDENT = 4
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class BackupState:
+    """ The class in question. """
+    repos: dict[str, dict] = field(default_factory=dict)
+
+    @classmethod
+    def read(cls) -> Self:
+        """
+        Create an instance of this class by reading the state file, starting
+        afresh if there isn't one or if it's been mangled.
+        """
+        try:
+            with open(PATH_TO_BACKUP_STATE, encoding="utf-8") as state_file:
+                init_dict = json.load(state_file)
+            return cls(**init_dict)
+        except (OSError, TypeError, ValueError):
+            return cls()
+
+    def write(self):
+        """ Write the state file, replacing the old one in a single step. """
+        path_to_temp = f"{PATH_TO_BACKUP_STATE}.{os.getpid()}.tmp"
+        with open(path_to_temp, "w", encoding="utf-8") as temp_file:
+            json.dump({"repos": self.repos}, temp_file, indent=JSON_INDENT)
+        os.replace(path_to_temp, PATH_TO_BACKUP_STATE)
+
+    def is_fresh(
+        self,
+        repo_name: str,
+        min_interval: float,
+        now: float|None = None
+    ) -> bool:
+        """ Decide whether a given repo was synced recently enough. """
+        if now is None:
+            now = time.time()
+        entry = self.repos.get(repo_name)
+        if not entry:
+            return False
+        return now-entry["last_synced"] < min_interval
+
+    def record(self, repo_name: str, head: str|None, now: float|None = None):
+        """ Record that a given repo has just been synced successfully. """
+        if now is None:
+            now = time.time()
+        self.repos[repo_name] = {"last_synced": now, "head": head}
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+@contextmanager
+def backup_lock(path_to_lock: str|None = None) -> Iterator[bool]:
+    """
+    Try to take the backup lock - or another lock, if given its path - WITHOUT
+    waiting for it, and yield whether we got it.
+    """
+    path_to_lock = path_to_lock or PATH_TO_BACKUP_LOCK
+    with open(path_to_lock, "a", encoding="utf-8") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
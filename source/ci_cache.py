@@ -0,0 +1,123 @@
+"""
+This code defines a cache of passing continuous integration stages, keyed on a
+hash of everything which could change a given stage's result.
+"""
+
+# Standard imports.
+import hashlib
+import json
+import os
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Self
+
+# Local constants.
+PATH_TO_CI_CACHE = ".hosker_ci_cache.json"
+JSON_INDENT = 4
+MISSING_FILE_MARKER = b"\0missing\0"
+PYCACHE_DIRNAME = "__pycache__"
+# Stages.
+LINT = "lint"
+TEST = "test"
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class CICache:
+    """ The class in question. """
+    passes: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def read(cls) -> Self:
+        """ Read the cache file, starting afresh if there isn't a good one. """
+        try:
+            with open(PATH_TO_CI_CACHE, encoding="utf-8") as cache_file:
+                init_dict = json.load(cache_file)
+            return cls(**init_dict)
+        except (OSError, TypeError, ValueError):
+            return cls()
+
+    def write(self):
+        """ Ronseal. """
+        path_to_temp = f"{PATH_TO_CI_CACHE}.{os.getpid()}.tmp"
+        with open(path_to_temp, "w", encoding="utf-8") as temp_file:
+            json.dump({"passes": self.passes}, temp_file, indent=JSON_INDENT)
+        os.replace(path_to_temp, PATH_TO_CI_CACHE)
+
+    def has_passed(self, stage: str, key: str) -> bool:
+        """ Decide whether a given stage last passed with this exact key. """
+        return self.passes.get(stage) == key
+
+    def record_pass(self, stage: str, key: str):
+        """ Remember that a given stage passed with a given key. """
+        self.passes[stage] = key
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def list_repo_files() -> list[str]:
+    """
+    List the files Git is tracking, plus any untracked files which it isn't
+    told to ignore - since the linter and the tests will see those too -
+    falling back to every Python file under the working directory if this
+    isn't a Git repo. Bytecode caches are left out either way.
+    """
+    try:
+        completed = subprocess.run(
+            [
+                "git",
+                "ls-files",
+                "-z",
+                "--cached",
+                "--others",
+                "--exclude-standard"
+            ],
+            check=True,
+            capture_output=True,
+            text=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return sorted(
+            str(path)
+            for path in Path().rglob("*.py")
+            if not any(part.startswith(".") for part in path.parts)
+        )
+    return sorted(
+        {
+            name
+            for name in completed.stdout.split("\0")
+            if name and PYCACHE_DIRNAME not in Path(name).parts
+        }
+    )
+
+def hash_files(paths: list[str]) -> str:
+    """ Hash the names and CURRENT contents of the given files. """
+    result = hashlib.sha256()
+    for path in sorted(set(paths)):
+        result.update(path.encode()+b"\0")
+        try:
+            result.update(Path(path).read_bytes())
+        except OSError:
+            result.update(MISSING_FILE_MARKER)
+    return result.hexdigest()
+
+def get_tool_version(command: list[str]) -> str:
+    """ Ask a given tool for its version, tolerating any failure. """
+    try:
+        completed = subprocess.run(
+            command+["--version"],
+            check=True,
+            capture_output=True,
+            text=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return completed.stdout.strip()
+
+def compute_key(*parts: str) -> str:
+    """ Combine several strings into a single cache key. """
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
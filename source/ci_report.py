@@ -0,0 +1,166 @@
+"""
+This code defines a class which times each stage of the continuous integration
+routine, and writes the timings to a report file and to a history file.
+"""
+
+# Standard imports.
+import json
+import os
+import resource
+import subprocess
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+# Local constants.
+PATH_TO_CI_REPORT = ".hosker_ci_report.json"
+PATH_TO_CI_HISTORY = ".hosker_ci_history.jsonl"
+JSON_INDENT = 4
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class CIReport:
+    """ The class in question. """
+    stages: list["StageTiming"] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+    start_counter: float = field(default_factory=time.perf_counter)
+
+    @contextmanager
+    def time_stage(self, name: str) -> Iterator["StageTiming"]:
+        """
+        Time whatever happens within this context, recording it as a stage
+        with the given name. The caller should set the stage's result.
+        """
+        stage = StageTiming(name=name)
+        wall_start = time.perf_counter()
+        cpu_start = get_cpu_time()
+        try:
+            yield stage
+        finally:
+            stage.wall_time = time.perf_counter()-wall_start
+            stage.cpu_time = get_cpu_time()-cpu_start
+            stage.peak_rss_kib = get_peak_rss()
+            self.stages.append(stage)
+
+    def record_stage(
+        self,
+        name: str,
+        result: bool,
+        usages: list["ProcessUsage|None"]
+    ) -> "StageTiming":
+        """
+        Record a stage which ran as one or more processes alongside other
+        stages, from what each of those processes used. The processes ran side
+        by side, so the stage took as long as the slowest of them.
+        """
+        usages = [usage for usage in usages if usage]
+        stage = StageTiming(name=name, result=result)
+        if usages:
+            stage.wall_time = max(usage.wall_time for usage in usages)
+            stage.cpu_time = sum(usage.cpu_time for usage in usages)
+            stage.peak_rss_kib = max(usage.peak_rss_kib for usage in usages)
+        self.stages.append(stage)
+        return stage
+
+    def to_dict(self, result: bool) -> dict:
+        """ Express the report as a JSON-friendly dictionary. """
+        return {
+            "started_at": self.started_at,
+            "commit": get_commit(),
+            "result": result,
+            # Stages may overlap, so don't just add up their wall times.
+            "wall_time": time.perf_counter()-self.start_counter,
+            "stages": [asdict(stage) for stage in self.stages]
+        }
+
+    def write(self, result: bool) -> dict:
+        """ Write the report file, and add a line to the history file. """
+        report = self.to_dict(result)
+        path_to_temp = f"{PATH_TO_CI_REPORT}.{os.getpid()}.tmp"
+        with open(path_to_temp, "w", encoding="utf-8") as temp_file:
+            json.dump(report, temp_file, indent=JSON_INDENT)
+        os.replace(path_to_temp, PATH_TO_CI_REPORT)
+        with open(PATH_TO_CI_HISTORY, "a", encoding="utf-8") as history_file:
+            history_file.write(json.dumps(report)+"\n")
+        return report
+
+################################
+# HELPER CLASSES AND FUNCTIONS #
+################################
+
+@dataclass
+class StageTiming:
+    """ The timings for a single stage. """
+    name: str
+    result: bool|None = None
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    peak_rss_kib: int = 0
+
+@dataclass
+class ProcessUsage:
+    """ What a single child process used. """
+    wall_time: float
+    cpu_time: float
+    peak_rss_kib: int
+
+def wait_with_usage(
+    process: subprocess.Popen,
+    started_at: float
+) -> ProcessUsage|None:
+    """
+    Wait for a given child process, which was started at the given
+    `perf_counter` time, and return what it alone used. Return None if
+    something else has already waited for it, e.g. in order to terminate it.
+    """
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        process.wait()
+        return None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return ProcessUsage(
+        wall_time=time.perf_counter()-started_at,
+        cpu_time=usage.ru_utime+usage.ru_stime,
+        peak_rss_kib=usage.ru_maxrss
+    )
+
+def get_cpu_time() -> float:
+    """
+    Get the CPU time, user plus system, used by this process AND by those
+    child processes which have finished.
+    """
+    result = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        result += usage.ru_utime+usage.ru_stime
+    return result
+
+def get_peak_rss() -> int:
+    """
+    Get the largest resident set size, in KiB, of this process or of any child
+    process which has finished so far. The operating system only keeps a
+    high-water mark, so a stage which uses less memory than an earlier stage
+    will report the earlier stage's peak.
+    """
+    return max(
+        resource.getrusage(who).ru_maxrss
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)
+    )
+
+def get_commit() -> str|None:
+    """ Get the commit we're testing, if we're in a Git repo. """
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            check=True,
+            capture_output=True,
+            text=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip()
@@ -0,0 +1,239 @@
+"""
+This code defines some functions for splitting a test suite into shards which
+can run side by side, balanced using how long each test took last time, and
+for merging the shards' results - and their coverage - back together.
+"""
+
+# Standard imports.
+import configparser
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Self
+from xml.etree import ElementTree
+
+# Local constants.
+PATH_TO_DURATIONS = ".hosker_ci_durations.json"
+JSON_INDENT = 4
+DEFAULT_DURATION = 1.0  # In seconds, for tests we haven't timed yet.
+COVERAGE_COMMAND = (sys.executable, "-m", "coverage")
+
+#############
+# FUNCTIONS #
+#############
+
+def collect_test_ids(test_command: list[str]) -> list[str]|None:
+    """
+    Ask PyTest which tests a given command would run, WITHOUT running them.
+    Return None if collection fails.
+    """
+    try:
+        completed = subprocess.run(
+            test_command+["--collect-only", "-q"],
+            check=True,
+            capture_output=True,
+            text=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return [line for line in completed.stdout.splitlines() if "::" in line]
+
+def read_durations() -> dict[str, float]:
+    """ Read how long each test took last time, if we know. """
+    try:
+        with open(PATH_TO_DURATIONS, encoding="utf-8") as durations_file:
+            result = json.load(durations_file)
+    except (OSError, ValueError):
+        return {}
+    return result if isinstance(result, dict) else {}
+
+def write_durations(durations: dict[str, float]):
+    """ Ronseal. """
+    path_to_temp = f"{PATH_TO_DURATIONS}.{os.getpid()}.tmp"
+    with open(path_to_temp, "w", encoding="utf-8") as temp_file:
+        json.dump(durations, temp_file, indent=JSON_INDENT, sort_keys=True)
+    os.replace(path_to_temp, PATH_TO_DURATIONS)
+
+def partition_tests(
+    test_ids: list[str],
+    shards: int,
+    durations: dict[str, float]
+) -> list[list[str]]:
+    """
+    Split the tests into at most the given number of non-empty shards, giving
+    each of the longest remaining tests to whichever shard has least to do.
+    Within each shard, the tests keep their collection order.
+    """
+    known = [durations[test_id] for test_id in test_ids if test_id in durations]
+    fallback = sum(known)/len(known) if known else DEFAULT_DURATION
+    order = {test_id: index for index, test_id in enumerate(test_ids)}
+    loads = [0.0 for _ in range(min(shards, len(test_ids)))]
+    result = [[] for _ in loads]
+    for test_id in sorted(
+        test_ids, key=lambda test_id: -durations.get(test_id, fallback)
+    ):
+        lightest = loads.index(min(loads))
+        loads[lightest] += durations.get(test_id, fallback)
+        result[lightest].append(test_id)
+    return [sorted(shard, key=order.get) for shard in result]
+
+def get_shard_command(
+    test_command: list[str],
+    test_ids: list[str],
+    path_to_report: str
+) -> list[str]:
+    """ Build the command which runs a given shard. """
+    return test_command+[f"--junitxml={path_to_report}"]+test_ids
+
+def get_junit_key(test_id: str) -> str:
+    """
+    Convert a PyTest node ID into the "classname::name" pair under which it
+    appears in a JUnit XML report.
+    """
+    path, bracket, parameters = test_id.partition("[")
+    names = path.split("::")
+    names[0] = re.sub(r"\.py$", "", names[0].replace("/", "."))
+    names[-1] += bracket+parameters
+    return ".".join(names[:-1])+"::"+names[-1]
+
+def merge_shard_reports(
+    paths_to_reports: list[str],
+    shards: list[list[str]]
+) -> "ShardSummary":
+    """ Add up the JUnit XML reports written by the shards. """
+    result = ShardSummary()
+    for path_to_report, test_ids in zip(paths_to_reports, shards, strict=True):
+        keys = {get_junit_key(test_id): test_id for test_id in test_ids}
+        try:
+            root = ElementTree.parse(path_to_report).getroot()
+        except (OSError, ElementTree.ParseError):
+            result.missing_reports += 1
+            continue
+        for suite in root.iter("testsuite"):
+            for attribute in ("tests", "failures", "errors", "skipped"):
+                setattr(
+                    result,
+                    attribute,
+                    getattr(result, attribute)+int(suite.get(attribute, 0))
+                )
+        for case in root.iter("testcase"):
+            key = f"{case.get('classname')}::{case.get('name')}"
+            if key in keys:
+                result.durations[keys[key]] = float(case.get("time", 0))
+    return result
+
+################################
+# HELPER CLASSES AND FUNCTIONS #
+################################
+
+@dataclass
+class ShardSummary:
+    """ The combined results of several shards. """
+    tests: int = 0
+    failures: int = 0
+    errors: int = 0
+    skipped: int = 0
+    missing_reports: int = 0
+    durations: dict[str, float] = field(default_factory=dict)
+
+    def describe(self, shards: int) -> str:
+        """ Summarise the results in a single line. """
+        result = (
+            f"{self.tests} tests in {shards} shards: "
+            f"{self.failures} failed, {self.errors} errors, "
+            f"{self.skipped} skipped"
+        )
+        if self.missing_reports:
+            result += f", {self.missing_reports} shards without a report"
+        return result
+
+@dataclass
+class ShardCoverage:
+    """
+    How to measure coverage in each shard, and then report it - and enforce
+    any floor - ONCE, on the combined data, since no shard sees the lot.
+    """
+    addopts: list[str] = field(default_factory=list)
+    reports: list[str] = field(default_factory=list)
+    fail_under: float|None = None
+
+    @classmethod
+    def read(cls, path_to_test_ini: str) -> Self|None:
+        """
+        Split the PyTest config's options into the reports and the floor, and
+        everything else. Return None if the config doesn't measure coverage.
+        """
+        parser = configparser.ConfigParser(interpolation=None)
+        try:
+            parser.read(path_to_test_ini, encoding="utf-8")
+            addopts = shlex.split(parser.get("pytest", "addopts", fallback=""))
+        except (configparser.Error, ValueError):
+            return None
+        if not any(
+            option == "--cov" or option.startswith("--cov=")
+            for option in addopts
+        ):
+            return None
+        result = cls()
+        options = iter(addopts)
+        for option in options:
+            name, equals, value = option.partition("=")
+            if name in ("--cov-report", "--cov-fail-under") and not equals:
+                value = next(options, "")
+            if name == "--cov-report":
+                result.reports.append(value)
+            elif name == "--cov-fail-under":
+                result.fail_under = float(value)
+            else:
+                result.addopts.append(option)
+        return result
+
+    def get_shard_options(self) -> list[str]:
+        """ Measure coverage in a shard, but neither report nor enforce it. """
+        return ["-o", f"addopts={shlex.join(self.addopts)}", "--cov-report="]
+
+    def get_report_commands(self) -> list[list[str]]:
+        """
+        Build the commands which make the configured reports from the combined
+        data, the first of which also enforces the floor.
+        """
+        term_command = [*COVERAGE_COMMAND, "report"]
+        result = [term_command]
+        for report in self.reports:
+            kind, _, modifier = report.partition(":")
+            if kind == "term-missing":
+                term_command.append("--show-missing")
+            if kind.startswith("term") and modifier == "skip-covered":
+                term_command.append("--skip-covered")
+            elif kind in ("html", "xml"):
+                command = [*COVERAGE_COMMAND, kind]
+                if modifier:
+                    command += ["-d" if kind == "html" else "-o", modifier]
+                result.append(command)
+        if self.fail_under is not None:
+            term_command.append(f"--fail-under={self.fail_under:g}")
+        return result
+
+    def combine_and_report(self, paths_to_data: list[str]) -> bool:
+        """
+        Combine the shards' data, and report on it. Return False if we're
+        under the floor, or if there was no data to judge.
+        """
+        paths_to_data = [path for path in paths_to_data if Path(path).exists()]
+        if not paths_to_data:
+            return self.fail_under is None
+        try:
+            subprocess.run(
+                [*COVERAGE_COMMAND, "combine", "--quiet", *paths_to_data],
+                check=True
+            )
+            for command in self.get_report_commands():
+                subprocess.run(command, check=True)
+        except (OSError, subprocess.CalledProcessError):
+            return False
+        return True
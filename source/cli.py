@@ -1,22 +1,133 @@
-"""Console entry points for Hosker Utils."""
+"""Console entry points for Hosker Utils.
 
-from pathlib import Path
+Each entry point imports what it needs when it runs, rather than at module
+level, so that `back-up-royal-repos`, which runs whenever a shell starts,
+doesn't load the installer, pip or CI machinery.
+"""
 
-from .hm_software_installer import install_hmss
-from .royal_repos_backup import back_up_royal_repos
+import argparse
+from pathlib import Path
 
-BASHRC_ADDITION = "back-up-royal-repos &>/dev/null & disown"
+BASHRC_ADDITION = "back-up-royal-repos --daemon &>/dev/null & disown"
+LEGACY_BASHRC_ADDITION = "back-up-royal-repos &>/dev/null & disown"
 PATH_TO_BASHRC = Path.home()/".bashrc"
 
 
-def back_up_royal_repos_cli() -> int:
+def back_up_royal_repos_cli(argv: list[str] | None = None) -> int:
     """Back up the configured repositories and return a shell exit code."""
+    parser = argparse.ArgumentParser(
+        description="Back up the royal repos, and any others configured."
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help=(
+            "ask the backup daemon to back up, becoming the daemon if there "
+            "isn't one running"
+        ),
+    )
+    parser.add_argument(
+        "--stop",
+        action="store_true",
+        help="stop the backup daemon, if there is one",
+    )
+    arguments = parser.parse_args(argv)
+    if arguments.stop:
+        from .backup_daemon import stop_backup_daemon
+
+        return 0 if stop_backup_daemon() else 1
+    if arguments.daemon:
+        from .backup_daemon import run_backup_daemon
+
+        return 0 if run_backup_daemon() else 1
+    from .royal_repos_backup import back_up_royal_repos
+
     return 0 if back_up_royal_repos() else 1
 
 
-def install_hmss_cli() -> int:
+def install_hmss_cli(argv: list[str] | None = None) -> int:
     """Run the interactive HMSS installer and return a shell exit code."""
-    return 0 if install_hmss(human_interface=True) else 1
+    from .fleet import DEFAULT_FLEET_MAX_WORKERS
+    from .hm_software_installer import install_hmss, plan_hmss
+
+    parser = argparse.ArgumentParser(
+        description="Install His Majesty's Software Suite on this machine."
+    )
+    parser.add_argument(
+        "--native",
+        action="store_true",
+        help=(
+            "run the steps from Python, side by side where possible, rather "
+            "than through the shell script"
+        ),
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help=(
+            "with --native, redo every step, even those which an earlier run "
+            "finished"
+        ),
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print what the installation would do, without doing it",
+    )
+    parser.add_argument(
+        "--fleet",
+        metavar="INVENTORY",
+        help=(
+            "install on every host listed in this JSON file, over SSH, using "
+            "this machine's config file"
+        ),
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_FLEET_MAX_WORKERS,
+        help=(
+            "with --fleet, how many hosts to install on at once "
+            f"(default: {DEFAULT_FLEET_MAX_WORKERS})"
+        ),
+    )
+    arguments = parser.parse_args(argv)
+    if arguments.fleet:
+        return run_fleet(arguments)
+    if arguments.dry_run:
+        plan = plan_hmss(
+            human_interface=True,
+            native=arguments.native,
+            fresh=arguments.fresh,
+        )
+        if not plan:
+            return 1
+        print(plan.describe())
+        return 0
+    return 0 if install_hmss(
+        human_interface=True, native=arguments.native, fresh=arguments.fresh
+    ) else 1
+
+
+def run_fleet(arguments: argparse.Namespace) -> int:
+    """Run the installer on every host in an inventory, and report."""
+    from .fleet import FleetInstaller, make_remote_command, read_inventory
+
+    try:
+        installer = FleetInstaller(
+            read_inventory(arguments.fleet),
+            max_workers=arguments.max_workers,
+            command=make_remote_command(
+                fresh=arguments.fresh, dry_run=arguments.dry_run
+            ),
+            dry_run=arguments.dry_run,
+        )
+        result = installer.run()
+    except (OSError, TypeError, ValueError) as exc:
+        print(f"Could not run the fleet installation: {exc}")
+        return 1
+    print(installer.describe(full_output=arguments.dry_run))
+    return 0 if result else 1
 
 
 def schedule_backup_cli() -> int:
@@ -26,9 +137,51 @@ def schedule_backup_cli() -> int:
     if BASHRC_ADDITION in existing:
         print("Looks like the bashrc addition is there already.")
         return 0
+    if LEGACY_BASHRC_ADDITION in existing:
+        PATH_TO_BASHRC.write_text(
+            existing.replace(LEGACY_BASHRC_ADDITION, BASHRC_ADDITION),
+            encoding="utf-8",
+        )
+        print("Replaced the old bashrc addition with the daemon trigger.")
+        return 0
 
     separator = "" if not existing or existing.endswith("\n") else "\n"
     with PATH_TO_BASHRC.open("a", encoding="utf-8") as bashrc:
         bashrc.write(f"{separator}{BASHRC_ADDITION}\n")
     return 0
 
+
+def build_wheelhouse_cli(argv: list[str] | None = None) -> int:
+    """Download or build wheels for offline installation."""
+    from .install_dependencies import (
+        DEFAULT_PATH_TO_WHEELHOUSE,
+        build_wheelhouse,
+    )
+
+    parser = argparse.ArgumentParser(
+        description=(
+            "Download or build wheels for the given requirements, and their "
+            "dependencies, into a directory for offline installation."
+        )
+    )
+    parser.add_argument("requirements", nargs="*", help="package strings")
+    parser.add_argument(
+        "-r",
+        "--requirement",
+        action="append",
+        default=[],
+        help="a requirements file; may be given more than once",
+    )
+    parser.add_argument(
+        "--wheel-dir",
+        default=DEFAULT_PATH_TO_WHEELHOUSE,
+        help=f"where to put the wheels (default: {DEFAULT_PATH_TO_WHEELHOUSE})",
+    )
+    arguments = parser.parse_args(argv)
+    if not (arguments.requirements or arguments.requirement):
+        parser.error("give at least one requirement or requirements file")
+    return 0 if build_wheelhouse(
+        arguments.requirements,
+        arguments.wheel_dir,
+        arguments.requirement,
+    ) else 1
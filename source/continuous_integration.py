@@ -4,14 +4,50 @@ integration routine.
 """
 
 # Standard imports.
+import importlib.util
+import os
 import shutil
 import subprocess
 import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
 from pathlib import Path
 
 # Non-standard imports.
 from termcolor import colored
 
+# Local imports.
+from .ci_cache import (
+    LINT,
+    PATH_TO_CI_CACHE,
+    TEST,
+    CICache,
+    compute_key,
+    get_tool_version,
+    hash_files,
+    list_repo_files,
+)
+from .ci_report import (
+    PATH_TO_CI_HISTORY,
+    PATH_TO_CI_REPORT,
+    CIReport,
+    StageTiming,
+    wait_with_usage,
+)
+from .ci_shards import (
+    PATH_TO_DURATIONS,
+    ShardCoverage,
+    collect_test_ids,
+    get_shard_command,
+    merge_shard_reports,
+    partition_tests,
+    read_durations,
+    write_durations,
+)
+from .impact_map import PATH_TO_IMPACT_MAP, ImpactMap
+
 DEFAULT_PATH_TO_LINTER_RC = "ruff.toml"
 PATH_TO_BACKUP_LINTER_RC = \
     str(Path(__file__).parent/"backup_configs"/"backup_ruff.toml")
@@ -20,6 +56,17 @@ PATH_TO_BACKUP_TEST_INI = \
     str(Path(__file__).parent/"backup_configs"/"backup_pytest.ini")
 PIP_INSTALL_THIS = ("pip", "install", ".")
 BUNDLED_RUFF_PATH = Path("/usr/lib/hosker-utils/ruff")
+LINTED_SUFFIXES = (".py", ".pyi")
+LINTER_CONFIG_FILENAMES = ("pyproject.toml", "ruff.toml", ".ruff.toml")
+# Files which this routine itself leaves lying around.
+ARTEFACT_PATHS = (
+    PATH_TO_CI_CACHE,
+    PATH_TO_IMPACT_MAP,
+    PATH_TO_DURATIONS,
+    PATH_TO_CI_REPORT,
+    PATH_TO_CI_HISTORY,
+    ".coverage",
+)
 
 #############
 # FUNCTIONS #
@@ -45,68 +92,509 @@ def print_encased(message, symbol="#", colour=None):
         print(" ")
     sys.stdout.flush()
 
-def run_tests(path_to_test_ini=DEFAULT_PATH_TO_TEST_INI):
-    """ Run PyTest. """
-    if not Path(path_to_test_ini).exists():
-        shutil.copy(PATH_TO_BACKUP_TEST_INI, path_to_test_ini)
-    try:
-        subprocess.run(
-            [sys.executable, "-m", "pytest", "-c", path_to_test_ini],
-            check=True
-        )
-    except (OSError, subprocess.CalledProcessError):
-        return False
-    return True
+def ensure_config_file(path_to_config, path_to_backup):
+    """ Copy in the backup config file if there isn't one already. """
+    if not Path(path_to_config).exists():
+        shutil.copy(path_to_backup, path_to_config)
 
-def run_linter(path_to_linter_rc=DEFAULT_PATH_TO_LINTER_RC):
-    """Run Ruff on this repo."""
-    if not Path(path_to_linter_rc).exists():
-        shutil.copy(PATH_TO_BACKUP_LINTER_RC, path_to_linter_rc)
-    ruff_command = shutil.which("ruff")
-    if BUNDLED_RUFF_PATH.exists():
-        ruff_command = str(BUNDLED_RUFF_PATH)
-    command = (
-        [ruff_command]
-        if ruff_command
-        else [sys.executable, "-m", "ruff"]
-    )
-    arguments = command + [
+def time_stage(report, name):
+    """ Time a given stage, if we've been given a report to write it into. """
+    if report is None:
+        return nullcontext(StageTiming(name=name))
+    return report.time_stage(name)
+
+def get_test_command(
+        path_to_test_ini=DEFAULT_PATH_TO_TEST_INI, paths_to_tests=None
+    ):
+    """
+    Build the command which runs PyTest, copying in a config if need be. If no
+    paths are given, run the whole suite.
+    """
+    ensure_config_file(path_to_test_ini, PATH_TO_BACKUP_TEST_INI)
+    result = [sys.executable, "-m", "pytest", "-c", path_to_test_ini]
+    if paths_to_tests is None:
+        return result
+    return result+get_partial_run_options()+paths_to_tests
+
+def get_partial_run_options():
+    """
+    A partial run can't meet a coverage threshold meant for the whole suite,
+    so switch coverage off, if the plugin which measures it is present.
+    """
+    if importlib.util.find_spec("pytest_cov"):
+        return ["--no-cov"]
+    return []
+
+def get_linter_command(
+        path_to_linter_rc=DEFAULT_PATH_TO_LINTER_RC, paths_to_lint=None
+    ):
+    """
+    Build the command which runs Ruff, copying in a config if need be. If no
+    paths are given, lint the whole repo.
+    """
+    ensure_config_file(path_to_linter_rc, PATH_TO_BACKUP_LINTER_RC)
+    result = get_ruff_command() + [
         "check",
         "--quiet",
         "--config",
         path_to_linter_rc,
-        ".",
     ]
+    if paths_to_lint is None:
+        return result+["."]
+    return result+["--force-exclude"]+paths_to_lint
+
+def get_ruff_command():
+    """ Decide which Ruff executable to use. """
+    ruff_command = shutil.which("ruff")
+    if BUNDLED_RUFF_PATH.exists():
+        ruff_command = str(BUNDLED_RUFF_PATH)
+    if ruff_command:
+        return [ruff_command]
+    return [sys.executable, "-m", "ruff"]
+
+def get_changed_files(base_ref=None):
+    """
+    List the files which differ between the working tree and a given base
+    ref - or HEAD, if none is given - including untracked files. If a base
+    ref is given, compare against where this branch forked from it. Return
+    None if Git can't tell us.
+    """
+    try:
+        since = "HEAD"
+        if base_ref:
+            since = read_command_output(["git", "merge-base", base_ref, "HEAD"])
+        diffed = read_command_output(
+            ["git", "diff", "--name-only", "--relative", "-z", since]
+        )
+        untracked = read_command_output(
+            ["git", "ls-files", "--others", "--exclude-standard", "-z"]
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    names = (diffed+"\0"+untracked).split("\0")
+    return sorted(
+        {name for name in names if name and name not in ARTEFACT_PATHS}
+    )
+
+def get_paths_to_lint(
+        path_to_linter_rc=DEFAULT_PATH_TO_LINTER_RC, base_ref=None
+    ):
+    """
+    Decide which changed files need linting. Return None - i.e. lint the lot -
+    if we can't tell what's changed, or if the linter's config has changed.
+    """
+    changed = get_changed_files(base_ref)
+    if changed is None:
+        return None
+    for path in changed:
+        if (
+            Path(path).name in LINTER_CONFIG_FILENAMES or
+            Path(path) == Path(path_to_linter_rc)
+        ):
+            return None
+    return [
+        path
+        for path in changed
+        if path.endswith(LINTED_SUFFIXES) and Path(path).exists()
+    ]
+
+def get_paths_to_tests(base_ref=None):
+    """
+    Decide which test files the changes relative to a given base ref (or HEAD)
+    could affect, keeping the persisted import map up to date as we go.
+    Return None - i.e. run the lot - if we can't be sure.
+    """
+    changed = get_changed_files(base_ref)
+    if changed is None:
+        return None
+    impact_map = ImpactMap.read()
+    impact_map.refresh(
+        sorted(
+            {
+                path
+                for path in list_repo_files()+changed
+                if path.endswith(".py")
+            }
+        )
+    )
+    impact_map.write()
+    return impact_map.select_tests(changed)
+
+def list_input_files():
+    """
+    List the repo's files, tracked or not, apart from those which this routine
+    itself writes, which would otherwise change every cache key on every run.
+    """
+    return [path for path in list_repo_files() if path not in ARTEFACT_PATHS]
+
+def get_lint_cache_key(path_to_linter_rc=DEFAULT_PATH_TO_LINTER_RC):
+    """
+    Hash everything which could change the linter's verdict: the Python
+    files, Ruff's config and Ruff's version.
+    """
+    paths = [
+        path
+        for path in list_input_files()
+        if path.endswith(LINTED_SUFFIXES) or path == "pyproject.toml"
+    ]
+    return compute_key(
+        hash_files(paths+[path_to_linter_rc]),
+        get_tool_version(get_ruff_command())
+    )
+
+def get_test_cache_key(path_to_test_ini=DEFAULT_PATH_TO_TEST_INI):
+    """
+    Hash everything which could change the tests' verdict: ALL the repo's
+    files, PyTest's config, and the versions of PyTest and Python.
+    """
+    return compute_key(
+        hash_files(list_input_files()+[path_to_test_ini]),
+        get_tool_version([sys.executable, "-m", "pytest"]),
+        sys.version
+    )
+
+def run_command(arguments):
+    """ Run a given command, and report whether it succeeded. """
     try:
         subprocess.run(arguments, check=True)
     except (OSError, subprocess.CalledProcessError):
         return False
     return True
 
+def read_command_output(arguments):
+    """ Run a given command, and return what it printed. """
+    return subprocess.run(
+        arguments, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+def run_commands_in_parallel(
+        commands, stop_on_failure=False, envs=None, usages=None
+    ):
+    """
+    Run several commands at once, capturing their output, and then print that
+    output in the order in which the commands were given. If we're stopping on
+    failure, terminate any commands still running once one has failed. If
+    given, envs holds an environment - or None, to inherit ours - for each
+    command, and usages is a list onto which what each command used - or None,
+    if we can't tell - is appended.
+    """
+    processes = []
+    started_at = time.perf_counter()
+    try:
+        for command, env in zip(
+            commands, envs or [None]*len(commands), strict=True
+        ):
+            processes.append(
+                subprocess.Popen(
+                    command,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    env=env
+                )
+            )
+    except OSError:
+        for process in processes:
+            process.kill()
+            process.communicate()
+        if usages is not None:
+            usages.extend(None for _ in commands)
+        return [False for _ in commands]
+    with ThreadPoolExecutor(max_workers=len(processes)) as executor:
+        futures = [
+            executor.submit(read_and_wait, process, started_at)
+            for process in processes
+        ]
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            failed = any(
+                processes[futures.index(future)].returncode != 0
+                for future in done
+            )
+            if failed and stop_on_failure:
+                for process, future in zip(processes, futures, strict=True):
+                    if not future.done():
+                        process.terminate()
+    for future in futures:
+        print(future.result()[0], end="")
+    sys.stdout.flush()
+    if usages is not None:
+        usages.extend(future.result()[1] for future in futures)
+    return [process.returncode == 0 for process in processes]
+
+def read_and_wait(process, started_at):
+    """
+    Read everything a given process prints, and then wait for it, returning
+    its output and what it used.
+    """
+    with process.stdout:
+        output = process.stdout.read()
+    return output, wait_with_usage(process, started_at)
+
+def run_sharded_tests(
+        shards,
+        path_to_test_ini=DEFAULT_PATH_TO_TEST_INI,
+        paths_to_tests=None,
+        leading_commands=(),
+        stop_on_failure=False,
+        usages=None
+    ):
+    """
+    Split the tests into shards, balanced using how long each test took last
+    time, and run the shards side by side - alongside any leading commands,
+    e.g. the linter. Return one result for each leading command, followed by
+    one for the tests as a whole. If given, usages is filled in as for
+    run_commands_in_parallel(). If the whole suite is run, and the config
+    measures coverage, each shard writes its own data, which are combined -
+    and any coverage floor enforced - once the shards are done.
+    """
+    coverage = None
+    if paths_to_tests is None and importlib.util.find_spec("pytest_cov"):
+        coverage = ShardCoverage.read(path_to_test_ini)
+    if coverage:
+        test_command = \
+            get_test_command(path_to_test_ini)+coverage.get_shard_options()
+    else:
+        test_command = get_test_command(path_to_test_ini, [])
+    test_ids = collect_test_ids(
+        get_test_command(path_to_test_ini, paths_to_tests or [])
+    )
+    if not test_ids:
+        return run_commands_in_parallel(
+            list(leading_commands) +
+            [get_test_command(path_to_test_ini, paths_to_tests)],
+            stop_on_failure=stop_on_failure,
+            usages=usages
+        )
+    durations = read_durations()
+    partitions = partition_tests(test_ids, shards, durations)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths_to_reports = [
+            str(Path(temp_dir)/f"shard_{index}.xml")
+            for index in range(len(partitions))
+        ]
+        paths_to_data = [
+            str(Path(temp_dir)/f".coverage.shard_{index}")
+            for index in range(len(partitions))
+        ]
+        envs = None
+        if coverage:
+            envs = [None]*len(leading_commands) + [
+                {**os.environ, "COVERAGE_FILE": path_to_data}
+                for path_to_data in paths_to_data
+            ]
+        results = run_commands_in_parallel(
+            list(leading_commands) + [
+                get_shard_command(test_command, partition, path_to_report)
+                for partition, path_to_report
+                in zip(partitions, paths_to_reports, strict=True)
+            ],
+            stop_on_failure=stop_on_failure,
+            envs=envs,
+            usages=usages
+        )
+        summary = merge_shard_reports(paths_to_reports, partitions)
+        print(summary.describe(len(partitions)))
+        sys.stdout.flush()
+        test_result = all(results[len(leading_commands):])
+        if test_result and coverage:
+            test_result = coverage.combine_and_report(paths_to_data)
+    durations.update(summary.durations)
+    write_durations(durations)
+    return results[:len(leading_commands)]+[test_result]
+
+def run_tests(
+        path_to_test_ini=DEFAULT_PATH_TO_TEST_INI,
+        changed_only=False,
+        base_ref=None,
+        shards=1
+    ):
+    """
+    Run PyTest - or, if so directed, just those tests which the changes
+    relative to a given base ref or to HEAD could affect. With more than one
+    shard, the tests are split between that many processes.
+    """
+    paths_to_tests = None
+    if changed_only:
+        paths_to_tests = get_paths_to_tests(base_ref)
+        if paths_to_tests == []:
+            return True
+    if shards > 1:
+        return run_sharded_tests(
+            shards,
+            path_to_test_ini=path_to_test_ini,
+            paths_to_tests=paths_to_tests
+        )[-1]
+    return run_command(get_test_command(path_to_test_ini, paths_to_tests))
+
+def run_linter(
+        path_to_linter_rc=DEFAULT_PATH_TO_LINTER_RC,
+        changed_only=False,
+        base_ref=None
+    ):
+    """
+    Run Ruff on this repo - or, if so directed, on just those files which have
+    changed relative to a given base ref or to HEAD.
+    """
+    paths_to_lint = None
+    if changed_only:
+        paths_to_lint = get_paths_to_lint(path_to_linter_rc, base_ref)
+        if paths_to_lint == []:
+            return True
+    return run_command(get_linter_command(path_to_linter_rc, paths_to_lint))
+
 def run_continuous_integration_no_print(
-        lint=True, test=True, stop_on_failure=False
+        lint=True,
+        test=True,
+        stop_on_failure=False,
+        parallel=False,
+        use_cache=False,
+        changed_only=False,
+        base_ref=None,
+        shards=1,
+        report=None
     ):
-    """ Execute a minimal continuous integration routine. """
+    """
+    Execute a minimal continuous integration routine. In parallel mode, the
+    linter and the tests run at the same time. With the cache, a stage is
+    skipped if it has already passed on an identical tree. In changed-only
+    mode, only files changed relative to the base ref (or HEAD) are linted,
+    and only the tests which those changes could affect are run. With more
+    than one shard, the tests are split between that many processes. If given
+    a CIReport, each stage is timed into it.
+    """
+    if use_cache:
+        return run_cached_continuous_integration(
+            lint=lint,
+            test=test,
+            stop_on_failure=stop_on_failure,
+            parallel=parallel,
+            changed_only=changed_only,
+            base_ref=base_ref,
+            shards=shards,
+            report=report
+        )
+    with time_stage(report, "config") as stage:
+        if lint:
+            ensure_config_file(
+                DEFAULT_PATH_TO_LINTER_RC, PATH_TO_BACKUP_LINTER_RC
+            )
+        if test:
+            ensure_config_file(
+                DEFAULT_PATH_TO_TEST_INI, PATH_TO_BACKUP_TEST_INI
+            )
+        stage.result = True
+    linter_options = {}
+    if changed_only:
+        linter_options = {"changed_only": True, "base_ref": base_ref}
+    test_options = dict(linter_options)
+    if shards > 1:
+        test_options["shards"] = shards
+    if parallel and lint and test:
+        paths_to_lint, paths_to_tests = None, None
+        if changed_only:
+            paths_to_lint = get_paths_to_lint(base_ref=base_ref)
+            paths_to_tests = get_paths_to_tests(base_ref)
+        if [] not in (paths_to_lint, paths_to_tests):
+            usages = []
+            if shards > 1:
+                results = run_sharded_tests(
+                    shards,
+                    paths_to_tests=paths_to_tests,
+                    leading_commands=[
+                        get_linter_command(paths_to_lint=paths_to_lint)
+                    ],
+                    stop_on_failure=stop_on_failure,
+                    usages=usages
+                )
+            else:
+                results = run_commands_in_parallel(
+                    [
+                        get_linter_command(paths_to_lint=paths_to_lint),
+                        get_test_command(paths_to_tests=paths_to_tests)
+                    ],
+                    stop_on_failure=stop_on_failure,
+                    usages=usages
+                )
+            if report is not None:
+                report.record_stage(LINT, results[0], usages[:1])
+                report.record_stage(TEST, results[-1], usages[1:])
+            return all(results)
     lint_result, test_result = True, True
     if lint:
-        lint_result = run_linter()
+        with time_stage(report, LINT) as stage:
+            lint_result = stage.result = run_linter(**linter_options)
         if (not lint_result) and stop_on_failure:
             return False
     if test:
-        test_result = run_tests()
+        with time_stage(report, TEST) as stage:
+            test_result = stage.result = run_tests(**test_options)
         if (not test_result) and stop_on_failure:
             return False
     return bool(lint_result and test_result)
 
-def run_continuous_integration(lint=True, test=True, stop_on_failure=False):
-    """ Run this file. """
+def run_cached_continuous_integration(lint=True, test=True, **kwargs):
+    """
+    As above, but skip any stage which passed on an identical tree. Any
+    further keyword arguments are passed on to the uncached routine. A stage
+    which only ran on part of the tree is never recorded as having passed.
+    """
+    cache = CICache.read()
+    keys = {}
+    partial_stages = set()
+    if kwargs.get("changed_only"):
+        # Only the changed files were linted, and only the affected tests run.
+        partial_stages.update((LINT, TEST))
+    with time_stage(kwargs.get("report"), "cache") as stage:
+        if lint:
+            get_linter_command()  # Ensure that the config file is in place.
+            keys[LINT] = get_lint_cache_key()
+        if test:
+            get_test_command()
+            keys[TEST] = get_test_cache_key()
+        stage.result = True
+    for stage_name, key in keys.items():
+        if cache.has_passed(stage_name, key):
+            print(
+                f"Nothing has changed since the {stage_name} stage last passed."
+            )
+    result = \
+        run_continuous_integration_no_print(
+            lint=lint and not cache.has_passed(LINT, keys.get(LINT)),
+            test=test and not cache.has_passed(TEST, keys.get(TEST)),
+            **kwargs
+        )
+    if result:
+        for stage_name, key in keys.items():
+            if stage_name not in partial_stages:
+                cache.record_pass(stage_name, key)
+        cache.write()
+    return result
+
+def run_continuous_integration(
+        lint=True, test=True, stop_on_failure=False, *, report=False, **kwargs
+    ):
+    """
+    Run this file. If so directed, time each stage, writing the timings to a
+    report file and a history file. Any further keyword arguments - parallel,
+    use_cache, etc - are passed on to the routine above.
+    """
     print_encased("Starting continuous integration routine...")
+    ci_report = CIReport() if report else None
     result = \
         run_continuous_integration_no_print(
-            lint=lint, test=test, stop_on_failure=stop_on_failure
+            lint=lint,
+            test=test,
+            stop_on_failure=stop_on_failure,
+            report=ci_report,
+            **kwargs
         )
     if result:
         print_encased("Continuous integration: PASS", colour="green")
     else:
         print_encased("Continuous integration: FAIL", colour="red")
+    if ci_report:
+        ci_report.write(result)
+        print(f"Timings written to {PATH_TO_CI_REPORT}")
     return result
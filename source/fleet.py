@@ -0,0 +1,222 @@
+"""
+This code defines a class which installs His Majesty's Software Suite on many
+hosts at once, sending each the same config file over a given transport.
+"""
+
+# Standard imports.
+import json
+import os
+import shlex
+import subprocess
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# Local imports.
+from . import hmss_config
+from .hmss_config import HMSSConfig
+
+# Local constants.
+DEFAULT_FLEET_MAX_WORKERS = 8
+DEFAULT_REMOTE_COMMAND = "install-hmss --native"
+REMOTE_PATH_TO_CONFIG = "~/hmss_config.json"
+# Replace the config atomically, backing up the old one if it differs.
+UPLOAD_CONFIG_COMMAND = (
+    f"cat > {REMOTE_PATH_TO_CONFIG}.tmp && "
+    f"if [ -f {REMOTE_PATH_TO_CONFIG} ] && "
+    f"! cmp -s {REMOTE_PATH_TO_CONFIG}.tmp {REMOTE_PATH_TO_CONFIG}; then "
+    f"cp -p {REMOTE_PATH_TO_CONFIG} {REMOTE_PATH_TO_CONFIG}.bak; fi && "
+    f"mv {REMOTE_PATH_TO_CONFIG}.tmp {REMOTE_PATH_TO_CONFIG}"
+)
+SSH_OPTIONS = ("-o", "BatchMode=yes")
+OUTPUT_TAIL_LENGTH = 5  # In lines.
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class FleetInstaller:
+    """ The class in question. """
+    hosts: list[str]
+    transport: "Transport|None" = None
+    max_workers: int = DEFAULT_FLEET_MAX_WORKERS
+    path_to_config: str|None = None
+    command: str = DEFAULT_REMOTE_COMMAND
+    dry_run: bool = False
+    results: list["HostResult"] = field(init=False, default_factory=list)
+
+    def __post_init__(self):
+        if not self.transport:
+            self.transport = SSHTransport()
+        if not self.path_to_config:
+            self.path_to_config = hmss_config.PATH_TO_HMSS_CONFIG
+
+    def _read_config_text(self) -> str:
+        """
+        Read the config file as it stands, so that each host fills in any
+        blanks - e.g. the path to the wallpaper - for itself. Reading it into
+        an HMSSConfig object first checks that it makes sense.
+        """
+        text = Path(self.path_to_config).read_text(encoding="utf-8")
+        HMSSConfig(**json.loads(text))
+        return text
+
+    def _install_on(self, host: str, config_text: str) -> "HostResult":
+        """
+        Send the config to a given host, and then run the installer. A dry run
+        leaves the host's config alone, and so plans from whatever is there.
+        """
+        result = HostResult(host)
+        start = time.perf_counter()
+        try:
+            returncode, output = 0, ""
+            if not self.dry_run:
+                returncode, output = self.transport.run(
+                    host, UPLOAD_CONFIG_COMMAND, input_text=config_text
+                )
+            if returncode == 0:
+                returncode, output = self.transport.run(host, self.command)
+        except OSError as exc:
+            returncode, output = None, str(exc)
+        result.duration = time.perf_counter()-start
+        result.success = returncode == 0
+        result.returncode = returncode
+        result.output = output
+        return result
+
+    def run(self) -> bool:
+        """ Install on every host, several at a time. """
+        config_text = self._read_config_text()
+        with ThreadPoolExecutor(
+            max_workers=max(self.max_workers, 1)
+        ) as executor:
+            self.results = list(
+                executor.map(
+                    lambda host: self._install_on(host, config_text),
+                    self.hosts
+                )
+            )
+        return all(result.success for result in self.results)
+
+    def describe(self, full_output: bool = False) -> str:
+        """
+        Summarise how each host got on as a table, followed by the last few
+        lines of output from each host which failed - or, if asked, all of the
+        output from every host.
+        """
+        width = max((len(result.host) for result in self.results), default=0)
+        lines = []
+        for result in self.results:
+            status = "ok" if result.success else "failed"
+            lines.append(
+                f"{result.host:<{width}}  {status:<8}{result.duration:8.1f}s"
+            )
+        for result in self.results:
+            if full_output:
+                lines.append(f"\n{result.host}:")
+                lines.extend("    "+line for line in result.output.splitlines())
+            elif not result.success:
+                lines.append(f"\n{result.host}:")
+                lines.extend(
+                    "    "+line for line in result.get_output_tail()
+                )
+        return "\n".join(lines)
+
+################################
+# HELPER CLASSES AND FUNCTIONS #
+################################
+
+@dataclass
+class HostResult:
+    """ How the installation went on a single host. """
+    host: str
+    success: bool = False
+    returncode: int|None = None
+    duration: float = 0.0
+    output: str = ""
+
+    def get_output_tail(self) -> list[str]:
+        """ Get the last few lines of output. """
+        return self.output.splitlines()[-OUTPUT_TAIL_LENGTH:]
+
+class Transport(ABC):
+    """
+    Runs a shell command on a given host, returning its exit code and its
+    combined output. Subclasses say how to reach the host.
+    """
+    @abstractmethod
+    def get_args(self, host: str, command: str) -> list[str]:
+        """ Make the arguments which run a given command on a given host. """
+
+    def get_env(self, host: str) -> dict[str, str]|None:
+        """ Make the environment in which to run the above, if special. """
+        return None
+
+    def run(
+        self,
+        host: str,
+        command: str,
+        input_text: str|None = None
+    ) -> tuple[int, str]:
+        """ Ronseal. """
+        completed = subprocess.run(
+            self.get_args(host, command),
+            input=input_text or "",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            env=self.get_env(host)
+        )
+        return completed.returncode, completed.stdout
+
+@dataclass
+class SSHTransport(Transport):
+    """
+    Reaches each host over SSH. Since nobody is there to type passwords, the
+    hosts must accept our key and let us use sudo without a password.
+    """
+    ssh_options: tuple[str, ...] = SSH_OPTIONS
+
+    def get_args(self, host: str, command: str) -> list[str]:
+        return ["ssh", *self.ssh_options, host, command]
+
+@dataclass
+class LocalTransport(Transport):
+    """
+    Runs each "host's" commands on this machine, with its home directory set
+    to a folder named after the host, which is useful for testing.
+    """
+    path_to_root: str
+
+    def get_args(self, host: str, command: str) -> list[str]:
+        return ["sh", "-c", command]
+
+    def get_env(self, host: str) -> dict[str, str]:
+        path_to_home = Path(self.path_to_root)/host
+        path_to_home.mkdir(parents=True, exist_ok=True)
+        return {**os.environ, "HOME": str(path_to_home)}
+
+def read_inventory(path_to_inventory: str) -> list[str]:
+    """
+    Read a list of hosts from a JSON file, which holds either a list of hosts
+    or an object with a "hosts" list.
+    """
+    with open(path_to_inventory, encoding="utf-8") as inventory_file:
+        inventory = json.load(inventory_file)
+    if isinstance(inventory, dict):
+        inventory = inventory.get("hosts")
+    if not isinstance(inventory, list) or \
+       not all(isinstance(host, str) for host in inventory):
+        raise ValueError(f"Not a list of hosts: {path_to_inventory}")
+    return inventory
+
+def make_remote_command(**flags: bool) -> str:
+    """ Add the given flags, where set, to the remote installer command. """
+    result = shlex.split(DEFAULT_REMOTE_COMMAND)
+    for name, value in flags.items():
+        if value:
+            result.append("--"+name.replace("_", "-"))
+    return shlex.join(result)
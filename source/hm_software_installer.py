@@ -4,17 +4,37 @@ required on this computer.
 """
 
 # Standard imports.
+import shutil
 import subprocess
-from dataclasses import dataclass
+import sys
+from dataclasses import dataclass, field
 from pathlib import Path
 
 # Local imports.
-from .hmss_config import HMSSConfig
+from .hmss_config import DEFAULT_CLONE_MAX_WORKERS, HMSSConfig
+from .install_dependencies import (
+    get_apt_download_sizes,
+    get_installed_apt_packages,
+    run_apt_install,
+)
+from .install_steps import (
+    DEFAULT_MAX_WORKERS,
+    PENDING,
+    RUNNING,
+    Step,
+    StepEngine,
+    StepJournal,
+    fingerprint_steps,
+)
+from .ssh_session import SSHSession, get_ssh_destination
 
 # Local constants.
 PATH_OBJ_TO_HERE = Path(__file__).parent
 PATH_TO_INSTALL_SCRIPT_BASE = str(PATH_OBJ_TO_HERE/"sh"/"install_hmss_base.sh")
 PATH_TO_INSTALL_SCRIPT_TEMP = str(Path.home()/"install_hmss_temp.sh")
+PATH_TO_HOME = str(Path.home())
+SCHEDULE_BACKUP_COMMAND = "schedule-back-up-royal-repos"
+CLONE_POOL = "clone"
 
 ##############
 # MAIN CLASS #
@@ -25,11 +45,21 @@ def install_hmss(*args, **kwargs) -> bool:
     installer_obj = HMSoftwareInstaller(*args, **kwargs)
     return installer_obj.run()
 
+def plan_hmss(*args, **kwargs) -> "InstallPlan|None":
+    """ As above, but only plan the installation. """
+    installer_obj = HMSoftwareInstaller(*args, **kwargs)
+    return installer_obj.plan()
+
 @dataclass
 class HMSoftwareInstaller:
     """ The class in question. """
     human_interface: bool = False
     config: HMSSConfig|None = None
+    native: bool = False
+    max_workers: int = DEFAULT_MAX_WORKERS
+    fresh: bool = False
+    steps: list[Step] = field(init=False, default_factory=list)
+    ssh_session: SSHSession|None = field(init=False, default=None)
 
     def __post_init__(self):
         if not self.config:
@@ -55,6 +85,12 @@ class HMSoftwareInstaller:
             ), (
                 "%ROYAL_REPOS%",
                 sh_list(self.config.royal_repos)
+            ), (
+                "%CLONE_MAX_WORKERS%",
+                str(self._get_clone_max_workers())
+            ), (
+                "%CLONE_OPTIONS%",
+                sh_list(self._get_clone_options())
             ), (
                 "%CLONE_METHOD%",
                 self.config.clone_method
@@ -86,10 +122,259 @@ class HMSoftwareInstaller:
         """ Remove any temporary files which have served their purpose. """
         Path(PATH_TO_INSTALL_SCRIPT_TEMP).unlink(missing_ok=True)
 
+    def _get_git_url_stem(self) -> str:
+        """ Make the stem of the URL from which to clone each royal repo. """
+        if self.config.clone_method == "https":
+            return (
+                f"https://{self.config.git_host}/"
+                f"{self.config.git_account_name}"
+            )
+        if self.config.clone_method == "ssh":
+            return f"git@{self.config.git_host}:{self.config.git_account_name}"
+        raise HMSSError(f"Bad clone method: {self.config.clone_method}")
+
+    def _install_git(self) -> bool:
+        """ Install Git, unless we've already got it. """
+        if shutil.which("git"):
+            return True
+        return run_apt_install(["git"], raise_error=False)
+
+    def _get_clone_max_workers(self) -> int:
+        """ Decide how many royal repos we may clone at once. """
+        return max(
+            self.config.clone_max_workers or DEFAULT_CLONE_MAX_WORKERS, 1
+        )
+
+    def _get_clone_options(self) -> list[str]:
+        """
+        Make any extra options for "git clone" which ask for a partial or
+        shallow clone, as per the config.
+        """
+        result = []
+        if self.config.clone_filter:
+            result.append(f"--filter={self.config.clone_filter}")
+        if self.config.clone_depth:
+            result += ["--depth", str(self.config.clone_depth)]
+        return result
+
+    def _clone_royal(self, repo_name: str) -> bool:
+        """ Clone a given royal repo, unless we've already got it. """
+        if (Path(PATH_TO_HOME)/repo_name).exists():
+            return True
+        env = None
+        if self.ssh_session:
+            self.ssh_session.note("clone")
+            env = self.ssh_session.get_git_env()
+        return run_step_command(
+            [
+                "git",
+                "clone",
+                *self._get_clone_options(),
+                f"{self._get_git_url_stem()}/{repo_name}"
+            ],
+            cwd=PATH_TO_HOME,
+            env=env
+        )
+
+    def _set_wallpaper(self) -> bool:
+        """ Ronseal. """
+        return run_step_command(
+            [
+                "gsettings",
+                "set",
+                "org.gnome.desktop.background",
+                "picture-uri",
+                f"file:///{self.config.path_to_wallpaper_file}"
+            ]
+        )
+
+    def _build_steps(self) -> list[Step]:
+        """
+        Model the installation routine as a set of steps. APT steps are
+        chained, since only one thing at a time may hold the dpkg lock, but Git
+        goes first, so that cloning - which needs only Git - can overlap with
+        the rest of the APT work. Setting the wallpaper waits for nothing. The
+        clones share a pool, so that we don't open too many connections to
+        the Git host at once.
+        """
+        essential = self.config.essential_apt_packages or []
+        non_essential = self.config.non_essential_apt_packages or []
+        royal_repos = self.config.royal_repos or []
+        self._get_git_url_stem()  # Fail early on a bad clone method.
+        result = [
+            Step("sudo", lambda: run_step_command(["sudo", "-v"], quiet=False)),
+            Step(
+                "apt update",
+                lambda: run_step_command(["sudo", "apt-get", "update"]),
+                depends_on=("sudo",)
+            ),
+            Step("git", self._install_git, depends_on=("apt update",)),
+            Step(
+                "apt upgrade",
+                lambda: run_step_command(
+                    ["sudo", "apt-get", "upgrade", "--yes"]
+                ),
+                depends_on=("git",),
+                inputs=[]
+            ),
+            Step(
+                "essential apt packages",
+                lambda: not essential or
+                run_apt_install(essential, raise_error=False),
+                depends_on=("apt upgrade",),
+                inputs=sorted(essential)
+            ),
+            Step(
+                "non-essential apt packages",
+                lambda: not non_essential or
+                run_apt_install(non_essential, raise_error=False),
+                depends_on=("essential apt packages",),
+                inputs=sorted(non_essential)
+            )
+        ]
+        clone_names = []
+        for repo_name in royal_repos:
+            clone_names.append(f"clone {repo_name}")
+            result.append(
+                Step(
+                    clone_names[-1],
+                    lambda repo_name=repo_name: self._clone_royal(repo_name),
+                    depends_on=("git",),
+                    inputs=[
+                        f"{self._get_git_url_stem()}/{repo_name}",
+                        self._get_clone_options()
+                    ],
+                    pool=CLONE_POOL
+                )
+            )
+        if royal_repos:
+            result.append(
+                Step(
+                    "schedule backup",
+                    lambda: run_step_command([SCHEDULE_BACKUP_COMMAND]),
+                    depends_on=tuple(clone_names),
+                    inputs=[]
+                )
+            )
+        result.append(
+            Step(
+                "wallpaper",
+                self._set_wallpaper,
+                inputs=self.config.path_to_wallpaper_file
+            )
+        )
+        return result
+
+    def _report_step(self, step: Step):
+        """ Tell the user how a given step is getting on. """
+        message = f"[{step.status}] {step.name}"
+        if step.duration is not None:
+            message += f" ({step.duration:.1f}s)"
+        if step.status not in (PENDING, RUNNING):
+            finished = sum(
+                1
+                for other in self.steps
+                if other.status not in (PENDING, RUNNING)
+            )
+            message += f" - {finished} of {len(self.steps)} steps finished"
+        print(message)
+        sys.stdout.flush()
+
+    def _run_native(self) -> bool:
+        """
+        Run the installation routine in Python, without a shell script. If we
+        have repos to clone over SSH, every clone shares one connection,
+        opened beforehand and closed afterwards.
+        """
+        destination = None
+        if any(
+            not (Path(PATH_TO_HOME)/repo_name).exists()
+            for repo_name in self.config.royal_repos or []
+        ):
+            destination = get_ssh_destination(
+                self.config.clone_method, self.config.git_host
+            )
+        if not destination:
+            return self._run_engine()
+        with SSHSession(destination) as session:
+            self.ssh_session = session
+            try:
+                return self._run_engine()
+            finally:
+                print(session.describe())
+                self.ssh_session = None
+
+    def _run_engine(self) -> bool:
+        """
+        Run the steps, skipping any which an earlier, unfinished run got
+        through with the same inputs - unless we've been told to start
+        afresh. The journal is only for resuming, so once every step has
+        succeeded, it's cleared.
+        """
+        self.steps = self._build_steps()
+        journal = StepJournal() if self.fresh else StepJournal.read()
+        engine = StepEngine(
+            self.steps,
+            max_workers=self.max_workers+self._get_clone_max_workers(),
+            on_change=self._report_step,
+            journal=journal,
+            pool_limits={CLONE_POOL: self._get_clone_max_workers()}
+        )
+        result = engine.run()
+        if result:
+            journal.clear()
+        print(engine.describe())
+        return result
+
+    def plan(self) -> "InstallPlan|None":
+        """
+        Work out what the installation routine would do, WITHOUT doing any of
+        it: which APT packages are missing, and how much they weigh; which
+        royal repos need cloning; and, for native runs, which steps the
+        journal would let us skip.
+        """
+        if not self.config:
+            return None
+        apt_packages = []
+        for package in (
+            (self.config.essential_apt_packages or [])+
+            (self.config.non_essential_apt_packages or [])
+        ):
+            if package not in apt_packages:
+                apt_packages.append(package)
+        royal_repos = self.config.royal_repos or []
+        if royal_repos and "git" not in apt_packages and \
+           not shutil.which("git"):
+            apt_packages.insert(0, "git")
+        installed = \
+            get_installed_apt_packages(apt_packages) if apt_packages else set()
+        missing = [
+            package for package in apt_packages if package not in installed
+        ]
+        result = InstallPlan(
+            missing_apt_packages=missing,
+            download_sizes=get_apt_download_sizes(missing) if missing else {},
+            repos_to_clone=[
+                repo_name
+                for repo_name in royal_repos
+                if not (Path(PATH_TO_HOME)/repo_name).exists()
+            ],
+            path_to_wallpaper=self.config.path_to_wallpaper_file
+        )
+        if self.native and not self.fresh:
+            steps = self._build_steps()
+            fingerprint_steps(steps)
+            journal = StepJournal.read()
+            result.unchanged_steps = \
+                [step.name for step in steps if journal.has_done(step)]
+        return result
+
     def run(self):
         """ Run the installation routine. """
         if not self.config:
             return False
+        if self.native:
+            return self._run_native()
         self._write_install_script()
         try:
             return self._run_install_script()
@@ -103,6 +388,81 @@ class HMSoftwareInstaller:
 class HMSSError(Exception):
     """ A custom exception. """
 
+@dataclass
+class InstallPlan:
+    """ What an installation would do, were we to run it. """
+    missing_apt_packages: list[str] = field(default_factory=list)
+    download_sizes: dict[str, int] = field(default_factory=dict)
+    repos_to_clone: list[str] = field(default_factory=list)
+    path_to_wallpaper: str|None = None
+    unchanged_steps: list[str] = field(default_factory=list)
+
+    def get_download_size(self) -> int:
+        """ Add up the sizes of those missing packages whose size we know. """
+        return sum(self.download_sizes.values())
+
+    def describe(self) -> str:
+        """ Summarise the plan for a human. """
+        unknown = [
+            package
+            for package in self.missing_apt_packages
+            if package not in self.download_sizes
+        ]
+        download = f"about {format_size(self.get_download_size())}"
+        if unknown:
+            download += f", plus unknown sizes for: {', '.join(unknown)}"
+        lines = [
+            "APT packages to install: "+
+            (", ".join(self.missing_apt_packages) or "none"),
+            f"Download size, excluding dependencies: {download}",
+            "Repos to clone: "+(", ".join(self.repos_to_clone) or "none"),
+            f"Wallpaper: {self.path_to_wallpaper or 'none'}"
+        ]
+        if self.unchanged_steps:
+            lines.append(
+                "Steps to skip, as already done: "+
+                ", ".join(self.unchanged_steps)
+            )
+        return "\n".join(lines)
+
+def format_size(num_bytes: int) -> str:
+    """ Express a number of bytes in a human-friendly unit. """
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB"):
+        if size < 1000:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1000
+    return f"{size:.1f} GB"
+
+def run_step_command(
+    args: list[str],
+    cwd: str|None = None,
+    quiet: bool = True,
+    env: dict[str, str]|None = None
+) -> bool:
+    """
+    Run a given command as part of an installation step. When quiet, the
+    command's output is held back, so that steps running side by side don't
+    talk over one another, and printed only if the command fails.
+    """
+    try:
+        subprocess.run(
+            args,
+            check=True,
+            cwd=cwd,
+            capture_output=quiet,
+            text=True,
+            env=env
+        )
+    except OSError as exc:
+        print(f"Could not run {' '.join(args)}: {exc}")
+        return False
+    except subprocess.CalledProcessError as exc:
+        if quiet:
+            print(f"{' '.join(args)} failed:\n{exc.stdout}{exc.stderr}")
+        return False
+    return True
+
 def sh_bool(py_bool: bool) -> str:
     """ Convert a Python boolean to its Shell Script equivalent. """
     if py_bool is True:
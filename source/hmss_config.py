@@ -13,6 +13,11 @@ from typing import Self
 DEFAULT_GIT_ACCOUNT_NAME = "tomhosker"
 DEFAULT_CLONE_METHOD = "https"
 DEFAULT_GIT_HOST = "github.com"
+DEFAULT_BACKUP_MAX_WORKERS = 4
+DEFAULT_BACKUP_MIN_INTERVAL = 600  # In seconds.
+DEFAULT_CLONE_MAX_WORKERS = 4
+DEFAULT_BACKUP_DISCOVERY_INTERVAL = 24*60*60  # In seconds.
+DEFAULT_BACKUP_DAEMON_INTERVAL = 60*60  # In seconds.
 JSON_INDENT = 4
 # Lists.
 DEFAULT_ESSENTIAL_APT_PACKAGES = ["git", "gedit-plugins"]
@@ -42,7 +47,17 @@ DEFAULT_HMSS_CONFIG = {
     "royal_repos": DEFAULT_ROYAL_REPOS,
     "clone_method": DEFAULT_CLONE_METHOD,
     "git_host": DEFAULT_GIT_HOST,
-    "git_account_name": DEFAULT_GIT_ACCOUNT_NAME
+    "git_account_name": DEFAULT_GIT_ACCOUNT_NAME,
+    "backup_max_workers": DEFAULT_BACKUP_MAX_WORKERS,
+    "backup_min_interval": DEFAULT_BACKUP_MIN_INTERVAL,
+    "backup_roots": [],
+    "backup_remotes": [],
+    "backup_discovery_interval": DEFAULT_BACKUP_DISCOVERY_INTERVAL,
+    "backup_daemon_interval": DEFAULT_BACKUP_DAEMON_INTERVAL,
+    "backup_precheck": False,
+    "clone_max_workers": DEFAULT_CLONE_MAX_WORKERS,
+    "clone_filter": None,
+    "clone_depth": None
 }
 
 ##############
@@ -61,6 +76,16 @@ class HMSSConfig:
     clone_method: str|None = None
     git_host: str|None = None
     git_account_name: str|None = None
+    backup_max_workers: int|None = None
+    backup_min_interval: float|None = None
+    backup_roots: list[str]|None = None
+    backup_remotes: list[str]|None = None
+    backup_discovery_interval: float|None = None
+    backup_daemon_interval: float|None = None
+    backup_precheck: bool|None = None
+    clone_max_workers: int|None = None
+    clone_filter: str|None = None
+    clone_depth: int|None = None
 
     def __post_init__(self):
         if not self.path_to_wallpaper_file:
@@ -0,0 +1,169 @@
+"""
+This code defines a class which maps each Python file in a repo to the test
+files which import it, directly or indirectly, so that we can run only those
+tests which a given change could affect.
+"""
+
+# Standard imports.
+import ast
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Self
+
+# Local constants.
+PATH_TO_IMPACT_MAP = ".hosker_ci_impact_map.json"
+JSON_INDENT = 4
+SOURCE_ROOT_NAMES = ("src",)
+CONFTEST_FILENAME = "conftest.py"
+# Changes to files with these suffixes can't affect the tests.
+INERT_SUFFIXES = (".md", ".rst", ".txt")
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class ImpactMap:
+    """ The class in question. """
+    files: dict[str, dict] = field(default_factory=dict)
+
+    @classmethod
+    def read(cls) -> Self:
+        """ Read the map file, starting afresh if there isn't a good one. """
+        try:
+            with open(PATH_TO_IMPACT_MAP, encoding="utf-8") as map_file:
+                init_dict = json.load(map_file)
+            return cls(**init_dict)
+        except (OSError, TypeError, ValueError):
+            return cls()
+
+    def write(self):
+        """ Ronseal. """
+        path_to_temp = f"{PATH_TO_IMPACT_MAP}.{os.getpid()}.tmp"
+        with open(path_to_temp, "w", encoding="utf-8") as temp_file:
+            json.dump({"files": self.files}, temp_file, indent=JSON_INDENT)
+        os.replace(path_to_temp, PATH_TO_IMPACT_MAP)
+
+    def refresh(self, paths: list[str]):
+        """
+        Bring the map up to date with the given Python files, re-parsing only
+        those which have been touched since we last looked at them.
+        """
+        result = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            fingerprint = [stat.st_mtime_ns, stat.st_size]
+            entry = self.files.get(path)
+            if not entry or entry["fingerprint"] != fingerprint:
+                entry = {
+                    "fingerprint": fingerprint,
+                    "imports": read_imports(path)
+                }
+            result[path] = entry
+        self.files = result
+
+    def get_dependencies(
+        self,
+        path: str,
+        modules: dict[str, list[str]]|None = None
+    ) -> set[str]:
+        """ Find every mapped file which a given file imports, however. """
+        if modules is None:
+            modules = self._get_modules()
+        result, stack = set(), [path]
+        while stack:
+            current = stack.pop()
+            if current in result:
+                continue
+            result.add(current)
+            for imported in self.files.get(current, {}).get("imports", []):
+                for module_name in get_parent_modules(imported):
+                    stack.extend(modules.get(module_name, []))
+        return result
+
+    def select_tests(self, changed_paths: list[str]) -> list[str]|None:
+        """
+        Select those test files which a given set of changes could affect.
+        Return None - i.e. run the lot - if any change isn't in the map.
+        """
+        modules = self._get_modules()
+        tests = [path for path in self.files if is_test_file(path)]
+        dependents = {}
+        for test in tests:
+            for dependency in self.get_dependencies(test, modules):
+                dependents.setdefault(dependency, set()).add(test)
+        result = set()
+        for path in changed_paths:
+            if path.endswith(INERT_SUFFIXES):
+                continue
+            if Path(path).name == CONFTEST_FILENAME or path not in dependents:
+                return None
+            result |= {test for test in dependents[path] if Path(test).exists()}
+        return sorted(result)
+
+    def _get_modules(self) -> dict[str, list[str]]:
+        """ Map each dotted module name to the file(s) which define it. """
+        result = {}
+        for path in self.files:
+            for module_name in get_module_names(path):
+                result.setdefault(module_name, []).append(path)
+        return result
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def is_test_file(path: str) -> bool:
+    """ Decide whether a given file is one which PyTest would collect. """
+    name = Path(path).name
+    return name.startswith("test_") or name.endswith("_test.py")
+
+def get_module_names(path: str) -> list[str]:
+    """ Work out the name(s) under which a given file could be imported. """
+    parts = list(PurePosixPath(path).with_suffix("").parts)
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    if not parts:
+        return []
+    result = [".".join(parts)]
+    if parts[0] in SOURCE_ROOT_NAMES and len(parts) > 1:
+        result.append(".".join(parts[1:]))
+    return result
+
+def get_parent_modules(module_name: str) -> list[str]:
+    """ Importing "a.b.c" runs "a" and "a.b" too. """
+    parts = module_name.split(".")
+    return [".".join(parts[:index]) for index in range(1, len(parts)+1)]
+
+def read_imports(path: str) -> list[str]:
+    """
+    List the modules which a given file imports, resolving relative imports
+    and including names which might be submodules, e.g. "from a import b"
+    gives both "a" and "a.b".
+    """
+    try:
+        tree = ast.parse(Path(path).read_bytes(), filename=path)
+    except (OSError, SyntaxError, ValueError):
+        return []
+    package = PurePosixPath(path).parent.parts
+    result = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            result |= {alias.name for alias in node.names}
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                anchor = package[:len(package)-node.level+1]
+                base = ".".join(list(anchor)+([base] if base else []))
+            if base:
+                result.add(base)
+            result |= {
+                f"{base}.{alias.name}" if base else alias.name
+                for alias in node.names
+            }
+    return sorted(result)
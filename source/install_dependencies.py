@@ -4,44 +4,140 @@ This code defines a function which installs a given list of PIP packages.
 
 # Standard imports.
 import subprocess
+from importlib import metadata
+from pathlib import Path
+
+# Non-standard imports.
+from packaging.requirements import InvalidRequirement, Requirement
+
+# Local constants.
+DEFAULT_PATH_TO_WHEELHOUSE = str(Path.home()/"hmss_wheelhouse")
 
 #############
 # FUNCTIONS #
 #############
 
-def install_dependency(package: str) -> bool:
+def run_pip_install(
+    packages: list[str],
+    path_to_wheelhouse: str|None = None
+) -> bool:
     """
-    Install a PIP package from a given package string, e.g. "pytest",
-    "ruff>=0.5.0", etc.
+    Run `pip install` on a given list of package strings. If given a
+    wheelhouse, install from that directory ALONE, without touching the
+    network.
+    """
+    args = ["pip", "install"]
+    if path_to_wheelhouse:
+        args += ["--no-index", "--find-links", path_to_wheelhouse]
+    try:
+        subprocess.run(args+packages, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+def build_wheelhouse(
+    packages: list[str],
+    path_to_wheelhouse: str = DEFAULT_PATH_TO_WHEELHOUSE,
+    requirement_files: list[str]|None = None
+) -> bool:
+    """
+    Download or build wheels for the given packages, and for everything they
+    depend on, into a directory from which they can later be installed
+    offline.
     """
+    args = ["pip", "wheel", "--wheel-dir", path_to_wheelhouse]
+    for requirement_file in requirement_files or []:
+        args += ["--requirement", requirement_file]
     try:
-        subprocess.run(["pip", "install", package], check=True)
+        subprocess.run(args+packages, check=True)
     except (OSError, subprocess.CalledProcessError):
         return False
     return True
 
-def install_dependencies(packages: list[str]) -> bool:
-    """ As above, but for several packages. """
+def is_satisfied(package: str) -> bool:
+    """
+    Decide, WITHOUT running PIP, whether a given package string is already
+    satisfied in the running environment. Anything we can't check cheaply,
+    e.g. extras or URLs, counts as unsatisfied.
+    """
+    try:
+        requirement = Requirement(package)
+    except InvalidRequirement:
+        return False
+    if requirement.marker and not requirement.marker.evaluate():
+        return True  # PIP would ignore this requirement too.
+    if requirement.url or requirement.extras:
+        return False
+    try:
+        version = metadata.version(requirement.name)
+    except metadata.PackageNotFoundError:
+        return False
+    return requirement.specifier.contains(version, prereleases=True)
+
+def install_dependency(
+    package: str,
+    path_to_wheelhouse: str|None = None
+) -> bool:
+    """
+    Install a PIP package from a given package string, e.g. "pytest",
+    "ruff>=0.5.0", etc, unless it's already satisfied. If given a wheelhouse,
+    install from there alone.
+    """
+    if is_satisfied(package):
+        return True
+    return run_pip_install([package], path_to_wheelhouse)
+
+def install_dependencies(
+    packages: list[str],
+    batch: bool = False,
+    path_to_wheelhouse: str|None = None
+) -> bool:
+    """
+    As above, but for several packages. In batch mode, PIP resolves and
+    installs the whole list in one go; if that fails, we fall back to
+    installing the packages one at a time, in order to find out which ones
+    are to blame.
+    """
+    options = {}
+    if path_to_wheelhouse:
+        options["path_to_wheelhouse"] = path_to_wheelhouse
+    if batch:
+        packages = [
+            package for package in packages if not is_satisfied(package)
+        ]
+    if batch and packages:
+        if run_pip_install(packages, path_to_wheelhouse):
+            return True
+        failed = [
+            package
+            for package in packages
+            if not install_dependency(package, **options)
+        ]
+        if failed:
+            print(f"Failed to install: {', '.join(failed)}")
+        else:
+            print(
+                "Each package installs on its own, but not together with the "
+                "others; check for conflicting requirements."
+            )
+        return False
     for package in packages:
         local_result = \
-            install_dependency(package)
+            install_dependency(package, **options)
         if not local_result:
             return False
     return True
 
-def install_apt_package(
-    package: str,
+def run_apt_install(
+    packages: list[str],
     yes: bool = True,
-    raise_error: bool = True,
-    quiet: bool = False
+    raise_error: bool = True
 ) -> bool:
-    """ Obviously, this will only work in a Debian-based system. """
+    """ Run `apt-get install` on a given list of packages, as superuser. """
     args = ["sudo", "apt-get", "install"]
     if yes:
         args += ["--yes"]
-    args += [package]
-    if not quiet:
-        print(f"I'm going to need superuser privileges to install {package}")
+    args += packages
     try:
         subprocess.run(args, check=True)
     except (OSError, subprocess.CalledProcessError):
@@ -50,12 +146,75 @@ def install_apt_package(
         return False
     return True
 
+def get_installed_apt_packages(packages: list[str]) -> set[str]:
+    """ Ask dpkg, ONCE, which of the given packages are already installed. """
+    try:
+        completed = subprocess.run(
+            [
+                "dpkg-query",
+                "--show",
+                "--showformat=${Package} ${db:Status-Status}\n",
+                *packages
+            ],
+            capture_output=True,
+            text=True
+        )
+    except OSError:
+        return set()
+    result = set()
+    for line in completed.stdout.splitlines():
+        name, _, status = line.partition(" ")
+        if status == "installed":
+            result.add(name)
+    return result
+
+def get_apt_download_sizes(packages: list[str]) -> dict[str, int]:
+    """
+    Look up, in the local APT cache, how many bytes each of the given packages
+    would take to download. Packages which the cache doesn't know about are
+    left out. Note that this doesn't account for dependencies.
+    """
+    try:
+        completed = subprocess.run(
+            ["apt-cache", "show", "--no-all-versions", *packages],
+            capture_output=True,
+            text=True
+        )
+    except OSError:
+        return {}
+    result = {}
+    for record in completed.stdout.split("\n\n"):
+        fields = dict(
+            line.split(": ", 1) for line in record.splitlines() if ": " in line
+        )
+        if "Package" in fields and fields.get("Size", "").isdigit():
+            result.setdefault(fields["Package"], int(fields["Size"]))
+    return result
+
+def install_apt_package(
+    package: str,
+    yes: bool = True,
+    raise_error: bool = True,
+    quiet: bool = False
+) -> bool:
+    """ Obviously, this will only work in a Debian-based system. """
+    if not quiet:
+        print(f"I'm going to need superuser privileges to install {package}")
+    return run_apt_install([package], yes=yes, raise_error=raise_error)
+
 def install_apt_packages(
     packages: list[str],
     quiet: bool = False,
+    batch: bool = False,
     **kwargs
 ) -> bool:
-    """ An iterative version of the above. """
+    """
+    An iterative version of the above. In batch mode, packages which are
+    already installed are skipped, and the rest are installed in a single APT
+    transaction.
+    """
+    if batch:
+        return install_apt_packages_in_batch(packages, quiet=quiet, **kwargs)
     if not quiet:
         print(
             "I'm going to need superuser privileges to install "
@@ -65,3 +224,25 @@ def install_apt_packages(
         if not install_apt_package(package, quiet=True, **kwargs):
             return False
     return True
+
+def install_apt_packages_in_batch(
+    packages: list[str],
+    quiet: bool = False,
+    **kwargs
+) -> bool:
+    """ As above, in batch mode. """
+    installed = get_installed_apt_packages(packages)
+    skipped = [package for package in packages if package in installed]
+    missing = [package for package in packages if package not in installed]
+    if missing:
+        if not quiet:
+            print(
+                "I'm going to need superuser privileges to install "
+                f"{', '.join(missing)}"
+            )
+        if not run_apt_install(missing, **kwargs):
+            return False
+    if not quiet:
+        print(f"Newly installed: {', '.join(missing) or 'none'}")
+        print(f"Skipped, as already installed: {', '.join(skipped) or 'none'}")
+    return True
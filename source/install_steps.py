@@ -0,0 +1,280 @@
+"""
+This code defines a simple engine which runs a set of steps, each of which may
+depend on others, running side by side any steps which don't depend on one
+another.
+"""
+
+# Standard imports.
+import hashlib
+import json
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Self
+
+# Local constants.
+DEFAULT_MAX_WORKERS = 4
+PATH_TO_INSTALL_JOURNAL = str(Path.home()/"hmss_install_journal.json")
+JSON_INDENT = 4
+# Statuses.
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+SKIPPED = "skipped"
+SUCCESSFUL_STATUSES = (DONE, UNCHANGED)
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class StepEngine:
+    """ The class in question. """
+    steps: list["Step"]
+    max_workers: int = DEFAULT_MAX_WORKERS
+    on_change: Callable[["Step"], None]|None = None
+    journal: "StepJournal|None" = None
+    pool_limits: dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._check_steps()
+        fingerprint_steps(self.steps)
+
+    def _check_steps(self):
+        """ Reject duplicate names, unknown dependencies and cycles. """
+        names = [step.name for step in self.steps]
+        if len(set(names)) != len(names):
+            raise StepError(f"Duplicate step names in: {names}")
+        for step in self.steps:
+            for dependency in step.depends_on:
+                if dependency not in names:
+                    raise StepError(
+                        f"Step {step.name} depends on unknown step "
+                        f"{dependency}"
+                    )
+        resolved = set()
+        remaining = list(self.steps)
+        while remaining:
+            ready = [
+                step
+                for step in remaining
+                if all(dependency in resolved for dependency in step.depends_on)
+            ]
+            if not ready:
+                raise StepError(
+                    "Circular dependencies among: "
+                    f"{[step.name for step in remaining]}"
+                )
+            resolved |= {step.name for step in ready}
+            remaining = [step for step in remaining if step not in ready]
+
+    def _set_status(self, step: "Step", status: str):
+        """ Update a step's status, and tell anyone who's listening. """
+        step.status = status
+        if self.on_change:
+            self.on_change(step)
+
+    def _get_ready(self) -> list["Step"]:
+        """ Find the pending steps whose dependencies are all done. """
+        statuses = {step.name: step.status for step in self.steps}
+        return [
+            step
+            for step in self.steps
+            if step.status == PENDING and
+            all(
+                statuses[name] in SUCCESSFUL_STATUSES
+                for name in step.depends_on
+            )
+        ]
+
+    def _skip_blocked(self):
+        """ Skip any pending step which depends on one which didn't finish. """
+        changed = True
+        while changed:
+            changed = False
+            statuses = {step.name: step.status for step in self.steps}
+            for step in self.steps:
+                if step.status == PENDING and any(
+                    statuses[name] in (FAILED, SKIPPED)
+                    for name in step.depends_on
+                ):
+                    self._set_status(step, SKIPPED)
+                    changed = True
+
+    def _run_step(self, step: "Step") -> bool:
+        """ Run a single step, timing it. """
+        start = time.perf_counter()
+        try:
+            return bool(step.action())
+        finally:
+            step.duration = time.perf_counter()-start
+
+    def _has_room(self, step: "Step", running: dict) -> bool:
+        """ Decide whether a given step's pool has room for it. """
+        if step.pool not in self.pool_limits:
+            return True
+        in_pool = sum(
+            1 for other in running.values() if other.pool == step.pool
+        )
+        return in_pool < self.pool_limits[step.pool]
+
+    def _start_ready(self, executor: ThreadPoolExecutor, running: dict):
+        """
+        Start every step which is ready to go and for which its pool has room,
+        apart from those which the journal says are finished and unchanged.
+        """
+        ready = self._get_ready()
+        while ready:
+            started = False
+            for step in ready:
+                if self.journal and self.journal.has_done(step):
+                    self._set_status(step, UNCHANGED)
+                    started = True
+                elif self._has_room(step, running):
+                    self._set_status(step, RUNNING)
+                    running[executor.submit(self._run_step, step)] = step
+                    started = True
+            if not started:
+                break
+            ready = self._get_ready()
+
+    def run(self) -> bool:
+        """ Run every step whose dependencies succeed. """
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                self._start_ready(executor, running)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    try:
+                        succeeded = future.result()
+                    except Exception as exc:  # Report it; don't crash.
+                        step.error = repr(exc)
+                        succeeded = False
+                    self._set_status(step, DONE if succeeded else FAILED)
+                    if self.journal:
+                        self.journal.record(step)
+                        self.journal.write()
+                self._skip_blocked()
+        return all(step.status in SUCCESSFUL_STATUSES for step in self.steps)
+
+    def describe(self) -> str:
+        """ Summarise the status and duration of each step as a table. """
+        width = max((len(step.name) for step in self.steps), default=0)
+        lines = []
+        for step in self.steps:
+            duration = \
+                "" if step.duration is None else f"{step.duration:8.1f}s"
+            lines.append(f"{step.name:<{width}}  {step.status:<8}{duration}")
+        return "\n".join(lines)
+
+################################
+# HELPER CLASSES AND FUNCTIONS #
+################################
+
+class StepError(Exception):
+    """ A custom exception. """
+
+def fingerprint_steps(steps: list["Step"]):
+    """
+    Fingerprint each step by its own inputs AND its dependencies'
+    fingerprints, so that a change to one step's inputs means re-running
+    everything downstream of it too. Steps without inputs are never
+    fingerprinted, and so always run.
+    """
+    fingerprints = {}
+    remaining = list(steps)
+    while remaining:
+        ready = [
+            step
+            for step in remaining
+            if all(name in fingerprints for name in step.depends_on)
+        ]
+        if not ready:
+            raise StepError(
+                "Unresolvable dependencies among: "
+                f"{[step.name for step in remaining]}"
+            )
+        for step in ready:
+            if step.inputs is not None:
+                step.fingerprint = hashlib.sha256(
+                    json.dumps(
+                        [
+                            step.inputs,
+                            [fingerprints[name] for name in step.depends_on]
+                        ]
+                    ).encode()
+                ).hexdigest()
+            fingerprints[step.name] = step.fingerprint
+        remaining = [step for step in remaining if step not in ready]
+
+@dataclass
+class StepJournal:
+    """
+    A record, kept on disk, of which steps have finished, and with what
+    fingerprint, so that an interrupted run can pick up where it left off.
+    """
+    completed: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def read(cls) -> Self:
+        """ Read the journal, starting afresh if there isn't a good one. """
+        try:
+            with open(PATH_TO_INSTALL_JOURNAL, encoding="utf-8") as journal:
+                init_dict = json.load(journal)
+            return cls(**init_dict)
+        except (OSError, TypeError, ValueError):
+            return cls()
+
+    def write(self):
+        """ Ronseal. """
+        path_to_temp = f"{PATH_TO_INSTALL_JOURNAL}.{os.getpid()}.tmp"
+        with open(path_to_temp, "w", encoding="utf-8") as temp_file:
+            json.dump(
+                {"completed": self.completed}, temp_file, indent=JSON_INDENT
+            )
+        os.replace(path_to_temp, PATH_TO_INSTALL_JOURNAL)
+
+    def clear(self):
+        """ Forget every step, deleting the journal file. """
+        self.completed.clear()
+        Path(PATH_TO_INSTALL_JOURNAL).unlink(missing_ok=True)
+
+    def has_done(self, step: "Step") -> bool:
+        """ Decide whether a given step has already finished, unchanged. """
+        if step.fingerprint is None:
+            return False
+        return self.completed.get(step.name) == step.fingerprint
+
+    def record(self, step: "Step"):
+        """ Record a given step's outcome. """
+        if step.status == DONE and step.fingerprint is not None:
+            self.completed[step.name] = step.fingerprint
+        else:
+            self.completed.pop(step.name, None)
+
+@dataclass
+class Step:
+    """
+    A single step, which succeeds if its action returns True. Its inputs,
+    which must be JSON-friendly, determine whether the journal lets it be
+    skipped; a step without inputs always runs. Steps in the same pool share
+    that pool's limit on how many may run at once.
+    """
+    name: str
+    action: Callable[[], bool]
+    depends_on: tuple[str, ...] = ()
+    inputs: Any = None
+    pool: str|None = None
+    fingerprint: str|None = None
+    status: str = PENDING
+    duration: float|None = None
+    error: str|None = None
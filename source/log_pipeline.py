@@ -0,0 +1,115 @@
+"""
+This code defines a logging pipeline, shared by everything which logs to a
+given file: records go onto a bounded queue, and a single thread writes them
+out, rotating the file once it gets too big. Whoever logs never waits on the
+disk, and if the writer falls far behind, records are dropped, not queued
+without limit.
+"""
+
+# Standard imports.
+import atexit
+import logging
+import queue
+import threading
+from dataclasses import dataclass, field
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Local constants.
+DEFAULT_LOG_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+MAX_LOG_BYTES = 1024*1024
+LOG_BACKUP_COUNT = 3
+MAX_QUEUE_SIZE = 10000  # In records.
+
+# Module-level state.
+_pipelines: dict[str, "LogPipeline"] = {}
+_pipelines_lock = threading.Lock()
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class LogPipeline:
+    """ The class in question. """
+    path_to_log: str
+    log_format: str = DEFAULT_LOG_FORMAT
+    logger: logging.Logger = field(init=False, default=None)
+    handler: "DroppingQueueHandler" = field(init=False, default=None)
+    listener: QueueListener = field(init=False, default=None)
+
+    def __post_init__(self):
+        file_handler = RotatingFileHandler(
+            self.path_to_log,
+            maxBytes=MAX_LOG_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
+            encoding="utf-8",
+            delay=True
+        )
+        file_handler.setFormatter(logging.Formatter(self.log_format))
+        log_queue = queue.Queue(maxsize=MAX_QUEUE_SIZE)
+        self.handler = DroppingQueueHandler(log_queue)
+        self.listener = QueueListener(
+            log_queue, file_handler, respect_handler_level=True
+        )
+        self.logger = logging.getLogger(f"{__name__}:{self.path_to_log}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self.listener.start()
+
+    def close(self):
+        """
+        Write out whatever is still queued, and how many records - if any -
+        were dropped, and then let go of the file.
+        """
+        self.logger.removeHandler(self.handler)
+        self.listener.stop()
+        if self.handler.dropped:
+            record = self.logger.makeRecord(
+                self.logger.name,
+                logging.WARNING,
+                __file__,
+                0,
+                "Dropped %s log records, since the log queue was full.",
+                (self.handler.dropped,),
+                None
+            )
+            for handler in self.listener.handlers:
+                handler.handle(record)
+        for handler in self.listener.handlers:
+            handler.close()
+
+################################
+# HELPER CLASSES AND FUNCTIONS #
+################################
+
+class DroppingQueueHandler(QueueHandler):
+    """ A queue handler which, rather than block, drops and counts records. """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def get_logger(
+    path_to_log: str,
+    log_format: str = DEFAULT_LOG_FORMAT
+) -> logging.Logger:
+    """ Get the logger which feeds the pipeline for a given file. """
+    with _pipelines_lock:
+        if path_to_log not in _pipelines:
+            _pipelines[path_to_log] = LogPipeline(path_to_log, log_format)
+        return _pipelines[path_to_log].logger
+
+def close_log_pipelines():
+    """ Close every pipeline, writing out whatever is still queued. """
+    with _pipelines_lock:
+        for pipeline in _pipelines.values():
+            pipeline.close()
+        _pipelines.clear()
+
+atexit.register(close_log_pipelines)
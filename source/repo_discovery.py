@@ -0,0 +1,150 @@
+"""
+This code defines a class which finds the Git repos under a set of root
+directories, and remembers what it found, so that the tree walk needn't be
+repeated every time we back up.
+"""
+
+# Standard imports.
+import json
+import os
+import subprocess
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Self
+
+# Local constants.
+PATH_TO_REPO_INDEX = str(Path.home()/"hm_git_repo_index.json")
+JSON_INDENT = 4
+MAX_DEPTH = 4  # How many directories below a root to look for repos.
+GIT_DIRNAME = ".git"
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class RepoIndex:
+    """ The class in question. """
+    roots: dict[str, dict] = field(default_factory=dict)
+
+    @classmethod
+    def read(cls) -> Self:
+        """ Read the index file, starting afresh if there isn't a good one. """
+        try:
+            with open(PATH_TO_REPO_INDEX, encoding="utf-8") as index_file:
+                init_dict = json.load(index_file)
+            return cls(**init_dict)
+        except (OSError, TypeError, ValueError):
+            return cls()
+
+    def write(self):
+        """ Ronseal. """
+        path_to_temp = f"{PATH_TO_REPO_INDEX}.{os.getpid()}.tmp"
+        with open(path_to_temp, "w", encoding="utf-8") as temp_file:
+            json.dump({"roots": self.roots}, temp_file, indent=JSON_INDENT)
+        os.replace(path_to_temp, PATH_TO_REPO_INDEX)
+
+    def is_stale(
+        self,
+        root: str,
+        max_age: float,
+        now: float|None = None
+    ) -> bool:
+        """ Decide whether a given root needs walking again. """
+        if now is None:
+            now = time.time()
+        entry = self.roots.get(root)
+        if not entry:
+            return True
+        return now-entry["discovered_at"] >= max_age
+
+    def refresh(
+        self,
+        roots: list[str],
+        max_age: float,
+        now: float|None = None
+    ) -> bool:
+        """
+        Walk those roots which we haven't walked within the given time, and
+        forget about any roots which are no longer wanted. Return whether
+        anything changed.
+        """
+        if now is None:
+            now = time.time()
+        changed = False
+        for root in roots:
+            if self.is_stale(root, max_age, now):
+                self.roots[root] = {
+                    "discovered_at": now,
+                    "repos": discover_repos(root)
+                }
+                changed = True
+        for root in list(self.roots):
+            if root not in roots:
+                del self.roots[root]
+                changed = True
+        return changed
+
+    def get_repos(self, remotes: list[str]|None = None) -> list[str]:
+        """
+        List the paths to the indexed repos which still exist and have a
+        remote - since there's nowhere to back the others up from - keeping
+        only those whose remote URL starts with one of the given remotes, if
+        any.
+        """
+        result = []
+        for entry in self.roots.values():
+            for repo in entry["repos"]:
+                if not repo["remote"]:
+                    continue
+                if remotes and not any(
+                    repo["remote"].startswith(remote) for remote in remotes
+                ):
+                    continue
+                if repo["path"] not in result and \
+                   (Path(repo["path"])/GIT_DIRNAME).exists():
+                    result.append(repo["path"])
+        return result
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def discover_repos(root: str, max_depth: int = MAX_DEPTH) -> list[dict]:
+    """
+    Find the Git repos under a given root, not looking inside repos or hidden
+    directories, nor deeper than the given depth.
+    """
+    path_obj_to_root = Path(root).expanduser()
+    result = []
+    for path_to_dir, dirnames, _ in os.walk(path_obj_to_root):
+        path_obj = Path(path_to_dir)
+        if (path_obj/GIT_DIRNAME).exists():
+            result.append(
+                {"path": str(path_obj), "remote": get_remote_url(str(path_obj))}
+            )
+            dirnames.clear()
+            continue
+        depth = len(path_obj.relative_to(path_obj_to_root).parts)
+        if depth >= max_depth:
+            dirnames.clear()
+        else:
+            dirnames[:] = sorted(
+                dirname for dirname in dirnames if not dirname.startswith(".")
+            )
+    return result
+
+def get_remote_url(path_to_repo: str) -> str|None:
+    """ Get the URL of a given repo's "origin" remote, if it has one. """
+    try:
+        completed = subprocess.run(
+            ["git", "config", "--get", "remote.origin.url"],
+            check=True,
+            cwd=path_to_repo,
+            capture_output=True,
+            text=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip()
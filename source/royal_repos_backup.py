@@ -5,15 +5,29 @@ This code defines a class which backs up the so-called royal repos.
 # Standard imports.
 import logging
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
 
 # Local imports.
-from .hmss_config import HMSSConfig
+from .backup_state import BackupState, backup_lock
+from .hmss_config import DEFAULT_BACKUP_DISCOVERY_INTERVAL, HMSSConfig
+from .log_pipeline import get_logger
+from .repo_discovery import RepoIndex, get_remote_url
+from .ssh_session import SSHSession, get_ssh_destination, uses_destination
 
 # Local constants.
 PATH_TO_LOG = str(Path.home()/"hm_git.log")
 LOG_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+# Backup states.
+UP_TO_DATE = "up to date"
+UPDATED = "updated"
+AHEAD = "ahead"
+DIVERGED = "diverged"
+PULLED = "pulled"
+NO_UPSTREAM = "skipped, no upstream"
+FAILED = "failed"
+SUCCESSFUL_STATES = (UP_TO_DATE, UPDATED, AHEAD, PULLED, NO_UPSTREAM)
 
 ##############
 # MAIN CLASS #
@@ -29,12 +43,23 @@ class RoyalReposBackup:
     """ The class in question. """
     human_interface: bool = False
     config: HMSSConfig = None
+    max_workers: int|None = None
+    incremental: bool = True
+    rediscover: bool = False
+    keep_state: bool = False
+    precheck: bool|None = None
     logger: logging.Logger = field(init=False, default=None)
+    state: BackupState|None = field(init=False, default=None)
+    git_env: dict[str, str]|None = field(init=False, default=None)
+    ssh_session: SSHSession|None = field(init=False, default=None)
+    ssh_paths: set[str] = field(init=False, default_factory=set)
 
     def __post_init__(self):
         if not self.config:
             self._auto_set_config()
         self._auto_set_logger()
+        if self.config and self.precheck is None:
+            self.precheck = bool(self.config.backup_precheck)
 
     def _auto_set_config(self):
         """ Ronseal. """
@@ -44,48 +69,295 @@ class RoyalReposBackup:
             self.config = HMSSConfig.read_machine()
 
     def _auto_set_logger(self):
-        """ Construct our logging object. """
-        result = logging.getLogger(f"{__name__}.{id(self)}")
-        result.setLevel(logging.INFO)
-        result.propagate = False
-        formatter = logging.Formatter(LOG_FORMAT)
-        file_handler = logging.FileHandler(PATH_TO_LOG)
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
-        result.addHandler(file_handler)
-        self.logger = result
-
-    def _fetch_royal(self, path_to: str) -> bool:
+        """
+        Get the logger which writes to our log file, through a pipeline shared
+        with every other instance, so that logging never waits on the disk.
+        """
+        self.logger = get_logger(PATH_TO_LOG, LOG_FORMAT)
+
+    def _get_max_workers(self) -> int:
+        """ Decide how many repos we may back up at once. """
+        result = self.max_workers or self.config.backup_max_workers or 1
+        return max(result, 1)
+
+    def _fetch_royal(self, path_to: str, errors: list[str]) -> bool:
         """ Run `git fetch` on a given repo. """
-        return self._run_git_command("fetch", path_to)
+        return self._run_git_command("fetch", path_to, errors)
 
-    def _pull_royal(self, path_to: str) -> bool:
+    def _pull_royal(self, path_to: str, errors: list[str]) -> bool:
         """ Run `git pull` on a given repo. """
-        return self._run_git_command("pull", path_to)
+        return self._run_git_command("pull", path_to, errors)
+
+    def _fast_forward_royal(self, path_to: str, errors: list[str]) -> bool:
+        """ Fast-forward a given repo to what we've already fetched. """
+        return self._run_git_command("merge --ff-only @{u}", path_to, errors)
+
+    def _run_git_command(
+        self,
+        command: str,
+        git_directory: str,
+        errors: list[str]
+    ) -> bool:
+        """
+        Run a given Git command in a given Git directory. Any error is
+        recorded in the list given, rather than being logged straight away, so
+        that several repos can be backed up at once without their log entries
+        getting jumbled.
+        """
+        return self._read_git_output(command, git_directory, errors) is not None
 
-    def _run_git_command(self, command: str, git_directory: str) -> bool:
-        """ Run a given Git command in a given Git directory. """
+    def _read_git_output(
+        self,
+        command: str,
+        git_directory: str,
+        errors: list[str]
+    ) -> str|None:
+        """ As above, but return what Git printed, or None on failure. """
+        env = None
+        if self.ssh_session and git_directory in self.ssh_paths:
+            self.ssh_session.note(command)
+            env = self.git_env
         try:
-            subprocess.run(["git", command], check=True, cwd=git_directory)
+            completed = subprocess.run(
+                ["git", *command.split()],
+                check=True,
+                cwd=git_directory,
+                capture_output=True,
+                text=True,
+                env=env
+            )
         except (OSError, subprocess.CalledProcessError) as exc:
-            self.logger.error(
-                "Non-zero exit code running git %s within %s: %s",
-                command,
-                git_directory,
-                format(exc)
+            message = (
+                f"Non-zero exit code running git {command} within "
+                f"{git_directory}: {format(exc)}"
             )
-            return False
-        return True
+            stderr = (getattr(exc, "stderr", None) or "").strip()
+            if stderr:
+                message += f" {stderr}"
+            errors.append(message)
+            return None
+        return completed.stdout.strip()
+
+    def _back_up_repo(self, repo_name: str) -> "RepoBackupResult":
+        """ Back up a given repo WITHOUT logging anything. """
+        path_to = get_path_to_repo(repo_name)
+        result = RepoBackupResult(repo_name=repo_name)
+        if self.incremental:
+            result.state = self._sync_incrementally(path_to, result)
+        elif (
+            self._fetch_royal(path_to, result.errors) and
+            self._pull_royal(path_to, result.errors)
+        ):
+            result.state = PULLED
+            result.head = \
+                self._read_git_output("rev-parse HEAD", path_to, result.errors)
+        result.success = result.state in SUCCESSFUL_STATES
+        return result
+
+    def _sync_incrementally(
+        self,
+        path_to: str,
+        repo_result: "RepoBackupResult"
+    ) -> str:
+        """
+        Fetch ONCE - or not at all, if the pre-check says there's nothing new
+        - and then only touch the working tree if upstream has actually moved.
+        A branch with no upstream has nothing to sync with, and so is skipped.
+        Return the resulting state.
+        """
+        errors = repo_result.errors
+        if self.precheck and not self._upstream_has_moved(path_to):
+            repo_result.fetched = False
+        elif not self._fetch_royal(path_to, errors):
+            return FAILED
+        heads_errors = []
+        heads = \
+            self._read_git_output("rev-parse HEAD @{u}", path_to, heads_errors)
+        if heads is None:
+            if not self._has_upstream(path_to):
+                return NO_UPSTREAM
+            errors.extend(heads_errors)
+            return FAILED
+        local, upstream = heads.split()
+        repo_result.head = local
+        if local == upstream:
+            return UP_TO_DATE
+        merge_base = self._read_git_output(
+            f"merge-base {local} {upstream}", path_to, errors
+        )
+        if merge_base == upstream:
+            return AHEAD
+        if merge_base != local:
+            errors.append(f"Local and upstream have diverged within {path_to}")
+            return DIVERGED
+        if not self._fast_forward_royal(path_to, errors):
+            return FAILED
+        repo_result.head = upstream
+        return UPDATED
+
+    def _has_upstream(self, path_to: str) -> bool:
+        """ Ask whether a given repo's current branch has an upstream. """
+        return self._read_git_output(
+            "rev-parse --abbrev-ref --symbolic-full-name @{u}", path_to, []
+        ) is not None
+
+    def _upstream_has_moved(self, path_to: str) -> bool:
+        """
+        Ask the remote, with a single `git ls-remote`, where the upstream
+        branch is, and compare that with where we last fetched it to. This
+        is much cheaper than a fetch. If we can't tell, assume it has moved.
+        """
+        errors = []  # A failed pre-check only costs us a fetch.
+        branch = self._read_git_output("symbolic-ref -q HEAD", path_to, errors)
+        if not branch:
+            return True
+        upstream_format = "%(upstream:remotename)|%(upstream:remoteref)"
+        upstream = self._read_git_output(
+            f"for-each-ref --format={upstream_format} {branch}",
+            path_to,
+            errors
+        )
+        if not upstream or "|" not in upstream:
+            return True
+        remote_name, remote_ref = upstream.split("|")
+        if not (remote_name and remote_ref):
+            return True
+        remote = self._read_git_output(
+            f"ls-remote {remote_name} {remote_ref}", path_to, errors
+        )
+        tracking = self._read_git_output("rev-parse @{u}", path_to, errors)
+        if not remote or not tracking:
+            return True
+        return remote.split()[0] != tracking
+
+    def _back_up_repos(self, repo_names: list[str]) -> list["RepoBackupResult"]:
+        """
+        Back up several repos, concurrently if so configured, returning the
+        results in the same order as the names given.
+        """
+        max_workers = min(self._get_max_workers(), len(repo_names))
+        if max_workers <= 1:
+            return [self._back_up_repo(name) for name in repo_names]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self._back_up_repo, repo_names))
+
+    def _back_up_repos_sharing_ssh(
+        self,
+        repo_names: list[str]
+    ) -> list["RepoBackupResult"]:
+        """
+        As above, but with every Git command sharing one SSH connection, which
+        is opened beforehand and closed afterwards - if Git uses SSH, and
+        there's anything to back up at all. Only those repos whose remote is
+        on the Git host share it; any others connect as usual.
+        """
+        destination = get_ssh_destination(
+            self.config.clone_method, self.config.git_host
+        )
+        if destination:
+            self.ssh_paths = {
+                path_to
+                for path_to in map(get_path_to_repo, repo_names)
+                if uses_destination(get_remote_url(path_to), destination)
+            }
+        if not self.ssh_paths:
+            return self._back_up_repos(repo_names)
+        with SSHSession(destination) as session:
+            self.ssh_session = session
+            self.git_env = session.get_git_env()
+            try:
+                return self._back_up_repos(repo_names)
+            finally:
+                self.logger.info(session.describe())
+                self.ssh_session = None
+                self.git_env = None
+                self.ssh_paths = set()
+
+    def _report(self, repo_result: "RepoBackupResult") -> bool:
+        """ Log the result of backing up a given repo. """
+        for message in repo_result.errors:
+            self.logger.error(message)
+        if repo_result.success:
+            self.logger.info("%s: %s", repo_result.repo_name, repo_result.state)
+        else:
+            self.logger.error("Error backing up: %s", repo_result.repo_name)
+        return repo_result.success
 
     def back_up_all(self) -> bool:
-        """ Back up ALL royal repos. """
+        """
+        Back up ALL royal repos, apart from any which were synced within the
+        configured minimum interval. If another backup is already underway,
+        leave it to get on with it.
+        """
         if not self.config:
             return False
+        with backup_lock() as locked:
+            if not locked:
+                self.logger.info("Another backup is already running.")
+                return True
+            return self._back_up_due()
+
+    def _get_repo_names(self) -> list[str]:
+        """
+        List the royal repos, followed by the paths to any other repos found
+        under the configured roots, with a remote - one of the configured
+        remotes, if any.
+        The roots are walked again only once the index of what we found last
+        time has gone stale.
+        """
+        result = list(self.config.royal_repos or [])
+        if not self.config.backup_roots:
+            return result
+        index = RepoIndex.read()
+        if self.rediscover:
+            max_age = 0
+        else:
+            max_age = \
+                self.config.backup_discovery_interval or \
+                DEFAULT_BACKUP_DISCOVERY_INTERVAL
+        if index.refresh(self.config.backup_roots, max_age):
+            index.write()
+        royal_paths = {get_path_to_repo(repo_name) for repo_name in result}
+        result += [
+            path_to_repo
+            for path_to_repo in index.get_repos(self.config.backup_remotes)
+            if path_to_repo not in royal_paths
+        ]
+        return result
+
+    def _back_up_due(self) -> bool:
+        """ Back up those repos which are due, and record the results. """
         result = True
+        state = self.state or BackupState.read()
+        min_interval = self.config.backup_min_interval or 0
+        all_repo_names = self._get_repo_names()
+        repo_names = [
+            repo_name
+            for repo_name in all_repo_names
+            if not state.is_fresh(repo_name, min_interval)
+        ]
         self.logger.info("Backing up royal repos...")
-        for repo in self.config.royal_repos:
-            if not self.back_up_one(repo):
+        skipped = len(all_repo_names)-len(repo_names)
+        if skipped:
+            self.logger.info("Skipping %s recently synced repos.", skipped)
+        repo_results = self._back_up_repos_sharing_ssh(repo_names)
+        for repo_result in repo_results:
+            if self._report(repo_result):
+                state.record(repo_result.repo_name, repo_result.head)
+            else:
                 result = False
+        unfetched = sum(
+            1 for repo_result in repo_results if not repo_result.fetched
+        )
+        if unfetched:
+            self.logger.info(
+                "Pre-check found nothing new for %s repos, so skipped "
+                "fetching them.",
+                unfetched
+            )
+        state.write()
+        if self.keep_state:
+            self.state = state
         if result:
             self.logger.info("Backed up royal repos successfully.")
         else:
@@ -94,11 +366,22 @@ class RoyalReposBackup:
 
     def back_up_one(self, repo_name: str) -> bool:
         """ Back up a given INDIVIDUAL royal repo. """
-        path_to = str(Path.home()/repo_name)
-        if not (
-            self._fetch_royal(path_to) and
-            self._pull_royal(path_to)
-        ):
-            self.logger.error("Error backing up: %s", repo_name)
-            return False
-        return True
+        return self._report(self._back_up_repo(repo_name))
+
+################################
+# HELPER CLASSES AND FUNCTIONS #
+################################
+
+def get_path_to_repo(repo_name: str) -> str:
+    """ Get the path to a given repo, relative to the home directory. """
+    return str(Path.home()/repo_name)
+
+@dataclass
+class RepoBackupResult:
+    """ Record what happened when we tried to back up a given repo. """
+    repo_name: str
+    success: bool = False
+    state: str = FAILED
+    head: str|None = None
+    fetched: bool = True
+    errors: list[str] = field(default_factory=list)
@@ -16,6 +16,8 @@ ESSENTIAL_APT_PACKAGES="%ESSENTIAL_APT_PACKAGES%"
 INSTALL_CHROME=%INSTALL_CHROME%
 NON_ESSENTIAL_APT_PACKAGES="%NON_ESSENTIAL_APT_PACKAGES%"
 ROYAL_REPOS="%ROYAL_REPOS%"
+CLONE_MAX_WORKERS=%CLONE_MAX_WORKERS%
+CLONE_OPTIONS="%CLONE_OPTIONS%"
 CLONE_METHOD="%CLONE_METHOD%"
 GIT_HOST="%GIT_HOST%"
 GIT_ACCOUNT_NAME="%GIT_ACCOUNT_NAME%"
@@ -34,6 +36,37 @@ sudo echo "Superuser privileges: activate!"
 
 # Ensure APT is up to date.
 sudo apt update
+
+# Install Git first, so that cloning can overlap with the rest of the APT work.
+if ! command -v git > /dev/null; then
+    sudo apt install --yes git
+fi
+
+# Make our Git URL stem.
+if [ $CLONE_METHOD = "https" ]; then
+    git_url_stem="https://$GIT_HOST/$GIT_ACCOUNT_NAME"
+elif [ $CLONE_METHOD = "ssh" ]; then
+    git_url_stem="git@$GIT_HOST:$GIT_ACCOUNT_NAME"
+else
+    echo "Bad CLONE_METHOD: $CLONE_METHOD"
+    exit 1
+fi
+
+# Clone royal repos, several at a time, in the background.
+if [ ! -z "$ROYAL_REPOS" ]; then
+    export COLOUR CLONE_OPTIONS git_url_stem
+    printf "%s\n" $ROYAL_REPOS | xargs -P "$CLONE_MAX_WORKERS" -I {} sh -c '
+        if [ -d "$1" ]; then
+            echo "${COLOUR}Looks like we already have $1..."
+        else
+            echo "${COLOUR}Cloning $1..."
+            git clone --quiet $CLONE_OPTIONS "$git_url_stem/$1" &&
+                echo "${COLOUR}Cloned $1."
+        fi
+    ' sh {} &
+    clone_pid=$!
+fi
+
 sudo apt upgrade --yes
 
 # Install essential APT packages.
@@ -54,25 +87,9 @@ else
     sudo apt install --yes $NON_ESSENTIAL_APT_PACKAGES
 fi
 
-# Make our Git URL stem.
-if [ $CLONE_METHOD = "https" ]; then
-    git_url_stem="https://$GIT_HOST/$GIT_ACCOUNT_NAME"
-elif [ $CLONE_METHOD = "ssh" ]; then
-    git_url_stem="git@$GIT_HOST:$GIT_ACCOUNT_NAME"
-else
-    echo "Bad CLONE_METHOD: $CLONE_METHOD"
-    exit 1
-fi
-
-# Clone royal repos.
-for repo_name in $ROYAL_REPOS; do
-    if [ -d $repo_name ]; then
-        echo "${COLOUR}Looks like we've already got $repo_name..."
-    else
-        git clone "$git_url_stem/$repo_name"
-    fi
-done
+# Wait for the clones to finish; this fails if any of them did.
 if [ ! -z "$ROYAL_REPOS" ]; then
+    wait $clone_pid
     schedule-back-up-royal-repos
 fi
 
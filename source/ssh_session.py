@@ -0,0 +1,149 @@
+"""
+This code defines a class which opens a single SSH connection to the Git host,
+for every Git command in a given run to share, and closes it afterwards.
+"""
+
+# Standard imports.
+import os
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Self
+
+# Local constants.
+PATH_TO_SSH_CONTROL_DIR = str(Path.home()/".ssh")
+SSH_CONTROL_DIR_MODE = 0o700
+SSH_TIMEOUT = 30  # In seconds.
+# Git commands which talk to the remote.
+NETWORK_COMMANDS = ("clone", "fetch", "ls-remote", "pull", "push")
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class SSHSession:
+    """ The class in question. """
+    destination: str
+    ssh_command: str = "ssh"
+    active: bool = field(init=False, default=False)
+    handshake_time: float|None = field(init=False, default=None)
+    uses: int = field(init=False, default=0)
+    _uses_lock: threading.Lock = \
+        field(init=False, repr=False, default_factory=threading.Lock)
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def _get_control_path(self) -> str:
+        """ Make a control path which no other run will be using. """
+        return str(
+            Path(PATH_TO_SSH_CONTROL_DIR)/f"hm_git_{os.getpid()}_{id(self)}"
+        )
+
+    def _run_control_command(self, *args: str) -> bool:
+        """
+        Run SSH with our control path. Output goes nowhere, since a master
+        which goes into the background would otherwise hold our pipes open.
+        """
+        try:
+            subprocess.run(
+                [
+                    self.ssh_command,
+                    "-o", "BatchMode=yes",
+                    "-o", f"ControlPath={self._get_control_path()}",
+                    *args,
+                    self.destination
+                ],
+                check=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=SSH_TIMEOUT
+            )
+        except (OSError, subprocess.SubprocessError):
+            return False
+        return True
+
+    def start(self) -> bool:
+        """
+        Open the master connection in the background, timing the handshake.
+        Return whether it worked; if it didn't, Git will connect as usual.
+        """
+        Path(PATH_TO_SSH_CONTROL_DIR).mkdir(
+            mode=SSH_CONTROL_DIR_MODE, parents=True, exist_ok=True
+        )
+        start = time.perf_counter()
+        self.active = self._run_control_command(
+            "-M", "-N", "-f", "-o", "ControlPersist=yes"
+        )
+        if self.active:
+            self.handshake_time = time.perf_counter()-start
+        return self.active
+
+    def stop(self):
+        """ Close the master connection, if we opened one. """
+        if self.active:
+            self._run_control_command("-O", "exit")
+            self.active = False
+        Path(self._get_control_path()).unlink(missing_ok=True)
+
+    def get_git_env(self) -> dict[str, str]|None:
+        """
+        Make an environment in which Git uses the master connection, or None
+        if there isn't one. Should the master die, SSH connects as usual.
+        """
+        if not self.active:
+            return None
+        return {
+            **os.environ,
+            "GIT_SSH_COMMAND": (
+                f"{self.ssh_command} -o ControlMaster=no "
+                f"-o ControlPath={self._get_control_path()}"
+            )
+        }
+
+    def note(self, git_command: str):
+        """ Count a given Git command as a use, if it talks to the remote. """
+        if self.active and git_command.split()[0] in NETWORK_COMMANDS:
+            with self._uses_lock:
+                self.uses += 1
+
+    def describe(self) -> str:
+        """ Summarise the handshakes which sharing the connection saved. """
+        if self.handshake_time is None:
+            return f"No shared SSH connection to {self.destination}."
+        saved = self.handshake_time*max(self.uses-1, 0)
+        return (
+            f"Shared one SSH connection to {self.destination} between "
+            f"{self.uses} Git commands: the handshake took "
+            f"{self.handshake_time:.2f}s, so sharing saved about {saved:.1f}s."
+        )
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def get_ssh_destination(clone_method: str|None, git_host: str|None) -> str|None:
+    """
+    Work out where to open a shared connection to, if Git will use SSH and
+    the user hasn't already told Git how to do so.
+    """
+    if clone_method != "ssh" or not git_host or "GIT_SSH_COMMAND" in os.environ:
+        return None
+    return f"git@{git_host}"
+
+def uses_destination(remote_url: str|None, destination: str) -> bool:
+    """
+    Ask whether Git would reach a given remote through a given SSH
+    destination, and so could share a connection to it.
+    """
+    if not remote_url:
+        return False
+    return remote_url.startswith((f"{destination}:", f"ssh://{destination}/"))
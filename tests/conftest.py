@@ -0,0 +1,48 @@
+"""Shared fixtures which keep the tests away from the real home directory."""
+
+from unittest.mock import patch
+
+import pytest
+
+from source.log_pipeline import close_log_pipelines
+
+
+@pytest.fixture(autouse=True)
+def isolated_state_files(tmp_path):
+    """Point state files, which live in the home directory, into tmp_path.
+
+    Log pipelines are closed afterwards, so that no test's writer thread
+    outlives it.
+    """
+    with (
+        patch(
+            "source.backup_state.PATH_TO_BACKUP_STATE",
+            str(tmp_path/"hm_git_state.json"),
+        ),
+        patch(
+            "source.backup_state.PATH_TO_BACKUP_LOCK",
+            str(tmp_path/"hm_git.lock"),
+        ),
+        patch(
+            "source.backup_daemon.PATH_TO_BACKUP_SOCKET",
+            str(tmp_path/"hm_git.sock"),
+        ),
+        patch(
+            "source.backup_daemon.PATH_TO_DAEMON_LOCK",
+            str(tmp_path/"hm_git_daemon.lock"),
+        ),
+        patch(
+            "source.ssh_session.PATH_TO_SSH_CONTROL_DIR",
+            str(tmp_path/"ssh_control"),
+        ),
+        patch(
+            "source.repo_discovery.PATH_TO_REPO_INDEX",
+            str(tmp_path/"hm_git_repo_index.json"),
+        ),
+        patch(
+            "source.install_steps.PATH_TO_INSTALL_JOURNAL",
+            str(tmp_path/"hmss_install_journal.json"),
+        ),
+    ):
+        yield
+    close_log_pipelines()
@@ -0,0 +1,100 @@
+"""Tests for the backup daemon and its socket trigger."""
+
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from source import backup_daemon
+from source.backup_daemon import (
+    OK,
+    SYNC,
+    UNKNOWN,
+    BackupDaemon,
+    run_backup_daemon,
+    send_message,
+    stop_backup_daemon,
+)
+from source.hmss_config import HMSSConfig
+
+
+def wait_for(condition, timeout=5):
+    """Wait until a condition holds, or fail."""
+    deadline = time.monotonic()+timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def start_daemon(backup):
+    """Serve a daemon in a thread, once its socket is ready."""
+    daemon = BackupDaemon(backup, interval=60)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(daemon.serve()))
+    thread.start()
+    wait_for(lambda: send_message(b"ping") == UNKNOWN)
+    return daemon, thread, results
+
+
+def test_triggers_are_coalesced():
+    """Many triggers during a backup lead to one more backup, not many."""
+    gate = threading.Event()
+    backup = MagicMock()
+    backup.back_up_all.side_effect = lambda: gate.wait(5)
+    daemon, thread, results = start_daemon(backup)
+
+    wait_for(lambda: backup.back_up_all.call_count == 1)
+    assert [send_message(SYNC) for _ in range(5)] == [OK]*5
+    gate.set()
+    wait_for(lambda: daemon.syncs == 2)
+    time.sleep(0.1)
+    assert backup.back_up_all.call_count == 2
+
+    assert stop_backup_daemon()
+    thread.join(5)
+    assert results == [True]
+    assert not Path(backup_daemon.PATH_TO_BACKUP_SOCKET).exists()
+    assert send_message(SYNC) is None
+    assert not stop_backup_daemon()
+
+
+def test_daemon_survives_a_failed_backup():
+    """A backup which raises is logged, and the next trigger still syncs."""
+    backup = MagicMock()
+    backup.back_up_all.side_effect = [OSError("disk full"), True]
+    daemon, thread, _ = start_daemon(backup)
+
+    wait_for(lambda: daemon.syncs == 1)
+    backup.logger.exception.assert_called_once()
+    assert send_message(SYNC) == OK
+    wait_for(lambda: daemon.syncs == 2)
+    assert stop_backup_daemon()
+    thread.join(5)
+
+
+def test_only_one_daemon_serves():
+    """A second daemon stands down, and the first is merely triggered."""
+    backup = MagicMock()
+    _, thread, _ = start_daemon(backup)
+    assert not BackupDaemon(MagicMock()).serve()
+    with patch("source.royal_repos_backup.RoyalReposBackup") as backup_mock:
+        assert run_backup_daemon()
+    backup_mock.assert_not_called()
+    assert stop_backup_daemon()
+    thread.join(5)
+
+
+def test_run_backup_daemon_becomes_the_daemon():
+    """With no daemon running, the caller becomes one, keeping its state."""
+    config = HMSSConfig(royal_repos=[], backup_daemon_interval=5)
+    with (
+        patch("source.royal_repos_backup.PATH_TO_LOG", "/dev/null"),
+        patch.object(BackupDaemon, "serve", return_value=True) as serve_mock,
+        patch("source.backup_daemon.BackupDaemon", wraps=BackupDaemon)
+        as daemon_mock,
+    ):
+        assert run_backup_daemon(config=config)
+    serve_mock.assert_called_once_with()
+    backup_obj = daemon_mock.call_args.args[0]
+    assert backup_obj.keep_state
+    assert daemon_mock.call_args.kwargs == {"interval": 5}
@@ -0,0 +1,34 @@
+"""Tests for the persistent backup state and the backup lock."""
+
+from source.backup_state import BackupState, backup_lock
+
+
+def test_backup_state_round_trip():
+    """Recorded syncs survive a write and a read, and then go stale."""
+    assert BackupState.read().repos == {}
+
+    state = BackupState()
+    state.record("chancery", "abc123", now=1000)
+    state.write()
+
+    reread = BackupState.read()
+    assert reread.repos == {"chancery": {"last_synced": 1000, "head": "abc123"}}
+    assert reread.is_fresh("chancery", 60, now=1059)
+    assert not reread.is_fresh("chancery", 60, now=1060)
+    assert not reread.is_fresh("hgmj", 60, now=1000)
+
+
+def test_mangled_backup_state_starts_afresh(tmp_path):
+    """A corrupt state file costs us a full backup, not a crash."""
+    (tmp_path/"hm_git_state.json").write_text("{", encoding="utf-8")
+    assert BackupState.read().repos == {}
+
+
+def test_backup_lock_is_exclusive():
+    """A second holder is turned away until the first lets go."""
+    with backup_lock() as first:
+        assert first
+        with backup_lock() as second:
+            assert not second
+    with backup_lock() as third:
+        assert third
@@ -0,0 +1,46 @@
+"""Tests which keep the console entry points quick to start."""
+
+import pytest
+
+from tools.benchmark_startup import (
+    ENTRY_POINT_IMPORTS,
+    PING_FORBIDDEN_MODULES,
+    benchmark,
+    main,
+    measure_imports,
+)
+
+
+def test_backup_entry_point_stays_slim():
+    """The login-time ping loads neither the backup engine nor the rest."""
+    total, modules = measure_imports(ENTRY_POINT_IMPORTS["back-up-royal-repos"])
+    assert total > 0
+    assert "source.backup_daemon" in modules
+    assert not set(PING_FORBIDDEN_MODULES) & set(modules)
+
+
+def test_package_imports_lazily():
+    """Importing the package loads no submodule until a name is used."""
+    _, modules = measure_imports("import source")
+    assert not [name for name in modules if name.startswith("source.")]
+    _, modules = measure_imports("from source import install_dependency")
+    assert "packaging.requirements" in modules
+    assert "termcolor" not in modules
+
+
+def test_tied_runs_are_benchmarked(monkeypatch):
+    """Runs with the same total don't need their modules comparing."""
+    monkeypatch.setattr(
+        "tools.benchmark_startup.measure_imports",
+        lambda statement: (100, {"module": 100}),
+    )
+    assert benchmark("build-wheelhouse", 3) == (100, {"module": 100})
+
+
+def test_benchmark_script(capsys):
+    """The script reports each entry point and enforces its budget."""
+    assert main(["schedule-back-up-royal-repos", "--repeat", "1"]) == 0
+    assert "schedule-back-up-royal-repos:" in capsys.readouterr().out
+    assert main(["install-hmss", "--repeat", "1", "--budget-ms", "0.001"]) == 1
+    with pytest.raises(SystemExit):
+        main(["no-such-command"])
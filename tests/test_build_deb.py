@@ -13,6 +13,7 @@ def test_deb_configuration_uses_project_version():
     assert deb["package-name"] == "hosker-utils"
     assert set(scripts) == {
         "back-up-royal-repos",
+        "build-wheelhouse",
         "install-hmss",
         "schedule-back-up-royal-repos",
     }
@@ -0,0 +1,66 @@
+"""Tests for the continuous-integration result cache."""
+
+import subprocess
+
+from source.ci_cache import (
+    LINT,
+    CICache,
+    compute_key,
+    get_tool_version,
+    hash_files,
+    list_repo_files,
+)
+
+
+def test_ci_cache_round_trip(tmp_path, monkeypatch):
+    """A recorded pass is matched only by the same key."""
+    monkeypatch.chdir(tmp_path)
+    assert CICache.read().passes == {}
+
+    cache = CICache()
+    cache.record_pass(LINT, "key")
+    cache.write()
+
+    reread = CICache.read()
+    assert reread.has_passed(LINT, "key")
+    assert not reread.has_passed(LINT, "other key")
+
+
+def test_hash_files_follows_contents(tmp_path, monkeypatch):
+    """Editing, or deleting, a file changes the hash."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path/"module.py").write_text("x = 1\n", encoding="utf-8")
+    original = hash_files(["module.py"])
+    assert hash_files(["module.py", "module.py"]) == original
+
+    (tmp_path/"module.py").write_text("x = 2\n", encoding="utf-8")
+    edited = hash_files(["module.py"])
+    assert edited != original
+
+    (tmp_path/"module.py").unlink()
+    assert hash_files(["module.py"]) not in (original, edited)
+
+
+def test_list_repo_files(tmp_path, monkeypatch):
+    """Git's view of the tree, untracked files included, is used."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path/"tracked.py").write_text("", encoding="utf-8")
+    (tmp_path/".hidden").mkdir()
+    (tmp_path/".hidden"/"ignored.py").write_text("", encoding="utf-8")
+    assert list_repo_files() == ["tracked.py"]
+
+    subprocess.run(["git", "init", "-q"], check=True)
+    (tmp_path/"untracked.py").write_text("", encoding="utf-8")
+    (tmp_path/"ignored.py").write_text("", encoding="utf-8")
+    (tmp_path/"__pycache__").mkdir()
+    (tmp_path/"__pycache__"/"tracked.pyc").write_bytes(b"")
+    (tmp_path/".gitignore").write_text("ignored.py\n", encoding="utf-8")
+    subprocess.run(["git", "add", "tracked.py"], check=True)
+    assert list_repo_files() == [".gitignore", "tracked.py", "untracked.py"]
+
+
+def test_keys_and_versions():
+    """Keys are stable, and a missing tool has an unknown version."""
+    assert compute_key("a", "b") == compute_key("a", "b")
+    assert compute_key("a", "b") != compute_key("ab")
+    assert get_tool_version(["/no/such/tool"]) == "unknown"
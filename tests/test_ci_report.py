@@ -0,0 +1,60 @@
+"""Tests for the continuous-integration timing report."""
+
+import json
+import subprocess
+import sys
+
+from source.ci_report import (
+    PATH_TO_CI_HISTORY,
+    PATH_TO_CI_REPORT,
+    CIReport,
+    ProcessUsage,
+    get_commit,
+)
+
+
+def test_ci_report(tmp_path, monkeypatch):
+    """Stages are timed, reported, and appended to the history."""
+    monkeypatch.chdir(tmp_path)
+    report = CIReport()
+    with report.time_stage("lint") as stage:
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        stage.result = True
+
+    assert report.write(True)["stages"][0]["name"] == "lint"
+    report.write(False)
+    written = json.loads((tmp_path/PATH_TO_CI_REPORT).read_text("utf-8"))
+    assert written["result"] is False
+    assert written["commit"] is None
+    assert written["stages"][0]["result"] is True
+    assert written["stages"][0]["wall_time"] > 0
+    assert written["stages"][0]["cpu_time"] > 0
+    assert written["stages"][0]["peak_rss_kib"] > 0
+    assert written["wall_time"] >= written["stages"][0]["wall_time"]
+    history = (tmp_path/PATH_TO_CI_HISTORY).read_text("utf-8").splitlines()
+    assert [json.loads(line)["result"] for line in history] == [True, False]
+
+
+def test_stages_from_processes():
+    """A stage run as several processes is as slow as the slowest of them."""
+    report = CIReport()
+    stage = report.record_stage(
+        "test",
+        True,
+        [ProcessUsage(1.0, 2.0, 100), None, ProcessUsage(3.0, 1.0, 50)],
+    )
+    assert (stage.wall_time, stage.cpu_time, stage.peak_rss_kib) == \
+        (3.0, 3.0, 100)
+    assert report.record_stage("lint", False, [None]).wall_time == 0
+    assert len(report.stages) == 2
+
+
+def test_get_commit(tmp_path, monkeypatch):
+    """The commit is reported within a Git repo."""
+    monkeypatch.chdir(tmp_path)
+    git = ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com"]
+    subprocess.run(git+["init", "-q"], check=True)
+    subprocess.run(
+        git+["commit", "-q", "--allow-empty", "-m", "Initial"], check=True
+    )
+    assert len(get_commit()) == 40
@@ -0,0 +1,94 @@
+"""Tests for splitting the test suite into shards and merging the results."""
+
+from source.ci_shards import (
+    COVERAGE_COMMAND,
+    ShardCoverage,
+    get_junit_key,
+    merge_shard_reports,
+    partition_tests,
+    read_durations,
+    write_durations,
+)
+
+REPORT = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite tests="2" failures="1" errors="0" skipped="0">
+<testcase classname="tests.test_a" name="test_one" time="0.5"/>
+<testcase classname="tests.test_a.TestThing" name="test_two[x]" time="2.0"/>
+</testsuite></testsuites>
+"""
+
+
+def test_partition_balances_by_duration():
+    """The slowest tests are spread out, and unknown tests get the mean."""
+    test_ids = ["a", "b", "c", "d", "e"]
+    durations = {"a": 10.0, "b": 6.0, "c": 4.0}
+
+    assert partition_tests(test_ids, 2, durations) == [
+        ["a", "b"],
+        ["c", "d", "e"],
+    ]
+    assert partition_tests(test_ids, 9, {}) == [[t] for t in test_ids]
+    assert partition_tests([], 4, {}) == []
+
+
+def test_junit_keys():
+    """Node IDs map onto JUnit's classname and name."""
+    assert get_junit_key("tests/test_a.py::test_one") == (
+        "tests.test_a::test_one"
+    )
+    assert get_junit_key("tests/test_a.py::TestThing::test_two[x.py]") == (
+        "tests.test_a.TestThing::test_two[x.py]"
+    )
+
+
+def test_merge_shard_reports(tmp_path):
+    """Counts are summed, durations recovered, and lost reports noted."""
+    (tmp_path/"shard_0.xml").write_text(REPORT, encoding="utf-8")
+    first_shard = [
+        "tests/test_a.py::test_one",
+        "tests/test_a.py::TestThing::test_two[x]",
+    ]
+    summary = merge_shard_reports(
+        [str(tmp_path/"shard_0.xml"), str(tmp_path/"shard_1.xml")],
+        [first_shard, ["tests/test_b.py::test_three"]],
+    )
+    assert summary.tests == 2
+    assert summary.failures == summary.missing_reports == 1
+    assert summary.durations == {
+        "tests/test_a.py::test_one": 0.5,
+        "tests/test_a.py::TestThing::test_two[x]": 2.0,
+    }
+    assert summary.describe(2) == (
+        "2 tests in 2 shards: 1 failed, 0 errors, 0 skipped, "
+        "1 shards without a report"
+    )
+
+
+def test_durations_round_trip(tmp_path, monkeypatch):
+    """Durations persist between runs."""
+    monkeypatch.chdir(tmp_path)
+    assert read_durations() == {}
+    write_durations({"a": 1.5})
+    assert read_durations() == {"a": 1.5}
+
+
+def test_shard_coverage_options(tmp_path):
+    """Shards measure coverage; reports and the floor wait for the merge."""
+    path_to_ini = tmp_path/"pytest.ini"
+    path_to_ini.write_text(
+        "[pytest]\naddopts = -q --cov=source --cov-report term:skip-covered "
+        "--cov-report=html --cov-fail-under 80\n",
+        encoding="utf-8",
+    )
+    coverage = ShardCoverage.read(str(path_to_ini))
+    assert coverage.addopts == ["-q", "--cov=source"]
+    assert coverage.get_shard_options() == [
+        "-o", "addopts=-q --cov=source", "--cov-report="
+    ]
+    assert coverage.get_report_commands() == [
+        [*COVERAGE_COMMAND, "report", "--skip-covered", "--fail-under=80"],
+        [*COVERAGE_COMMAND, "html"],
+    ]
+    assert not coverage.combine_and_report([str(tmp_path/"missing")])
+    path_to_ini.write_text("[pytest]\naddopts = -q\n", encoding="utf-8")
+    assert ShardCoverage.read(str(path_to_ini)) is None
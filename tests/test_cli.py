@@ -2,29 +2,82 @@
 
 from unittest.mock import patch
 
+import pytest
+
 from source.cli import (
     BASHRC_ADDITION,
+    LEGACY_BASHRC_ADDITION,
     back_up_royal_repos_cli,
+    build_wheelhouse_cli,
     install_hmss_cli,
     schedule_backup_cli,
 )
 
 
-@patch("source.cli.back_up_royal_repos")
+@patch("source.royal_repos_backup.back_up_royal_repos")
 def test_backup_exit_code(backup_mock):
     """The backup command exposes success and failure to the shell."""
     backup_mock.side_effect = [True, False]
-    assert back_up_royal_repos_cli() == 0
-    assert back_up_royal_repos_cli() == 1
+    assert back_up_royal_repos_cli([]) == 0
+    assert back_up_royal_repos_cli([]) == 1
+
 
+@patch("source.backup_daemon.stop_backup_daemon", return_value=False)
+@patch("source.backup_daemon.run_backup_daemon", return_value=True)
+def test_backup_daemon_options(daemon_mock, stop_mock):
+    """The backup command can trigger, or stop, the daemon."""
+    assert back_up_royal_repos_cli(["--daemon"]) == 0
+    daemon_mock.assert_called_once_with()
+    assert back_up_royal_repos_cli(["--stop"]) == 1
+    stop_mock.assert_called_once_with()
 
-@patch("source.cli.install_hmss")
+
+@patch("source.hm_software_installer.install_hmss")
 def test_installer_exit_code(installer_mock):
     """The installer command exposes success and failure to the shell."""
     installer_mock.side_effect = [True, False]
-    assert install_hmss_cli() == 0
-    assert install_hmss_cli() == 1
-    installer_mock.assert_called_with(human_interface=True)
+    assert install_hmss_cli([]) == 0
+    assert install_hmss_cli(["--native"]) == 1
+    installer_mock.assert_called_with(
+        human_interface=True, native=True, fresh=False
+    )
+
+
+@patch("source.hm_software_installer.plan_hmss")
+@patch("source.hm_software_installer.install_hmss")
+def test_installer_dry_run(installer_mock, plan_mock, capsys):
+    """A dry run prints the plan and installs nothing."""
+    plan_mock.return_value.describe.return_value = "the plan"
+    assert install_hmss_cli(["--dry-run", "--native"]) == 0
+    assert capsys.readouterr().out == "the plan\n"
+    plan_mock.assert_called_once_with(
+        human_interface=True, native=True, fresh=False
+    )
+    installer_mock.assert_not_called()
+
+    plan_mock.return_value = None
+    assert install_hmss_cli(["--dry-run"]) == 1
+
+
+@patch("source.fleet.FleetInstaller")
+def test_installer_fleet(fleet_mock, tmp_path, capsys):
+    """A fleet run reads the inventory and reports each host."""
+    inventory_path = tmp_path/"inventory.json"
+    inventory_path.write_text('["a", "b"]', encoding="utf-8")
+    fleet_mock.return_value.run.return_value = True
+    fleet_mock.return_value.describe.return_value = "the table"
+    arguments = ["--fleet", str(inventory_path), "--max-workers", "3"]
+    assert install_hmss_cli(arguments) == 0
+    fleet_mock.assert_called_once_with(
+        ["a", "b"],
+        max_workers=3,
+        command="install-hmss --native",
+        dry_run=False,
+    )
+    assert capsys.readouterr().out == "the table\n"
+
+    assert install_hmss_cli(["--fleet", str(tmp_path/"missing.json")]) == 1
+    assert "Could not run" in capsys.readouterr().out
 
 
 def test_schedule_backup(tmp_path):
@@ -39,3 +92,31 @@ def test_schedule_backup(tmp_path):
     assert bashrc_path.read_text(encoding="utf-8") == (
         f"existing command\n{BASHRC_ADDITION}\n"
     )
+
+
+def test_schedule_backup_replaces_legacy_line(tmp_path):
+    """The old per-shell backup becomes a trigger for the daemon."""
+    bashrc_path = tmp_path/".bashrc"
+    bashrc_path.write_text(
+        f"before\n{LEGACY_BASHRC_ADDITION}\nafter\n", encoding="utf-8"
+    )
+
+    with patch("source.cli.PATH_TO_BASHRC", bashrc_path):
+        assert schedule_backup_cli() == 0
+
+    assert bashrc_path.read_text(encoding="utf-8") == (
+        f"before\n{BASHRC_ADDITION}\nafter\n"
+    )
+
+
+@patch("source.install_dependencies.build_wheelhouse")
+def test_build_wheelhouse_cli(build_mock):
+    """The wheelhouse command passes its arguments through."""
+    build_mock.side_effect = [True, False]
+    arguments = ["one", "-r", "reqs.txt", "--wheel-dir", "w"]
+    assert build_wheelhouse_cli(arguments) == 0
+    build_mock.assert_called_with(["one"], "w", ["reqs.txt"])
+    assert build_wheelhouse_cli(["one"]) == 1
+
+    with pytest.raises(SystemExit):
+        build_wheelhouse_cli([])
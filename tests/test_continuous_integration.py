@@ -3,16 +3,39 @@ This code tests some of the continuous integration functions.
 """
 
 # Standard imports.
+import json
+import subprocess
+import sys
+import time
 from unittest.mock import patch
 
+from source.ci_report import PATH_TO_CI_REPORT, CIReport
+from source.ci_shards import read_durations
+
 # Source imports.
 from source.continuous_integration import (
+    get_changed_files,
+    get_lint_cache_key,
+    get_paths_to_lint,
+    get_paths_to_tests,
+    get_test_cache_key,
     print_encased,
+    run_commands_in_parallel,
     run_continuous_integration,
     run_continuous_integration_no_print,
     run_linter,
+    run_sharded_tests,
+    run_tests,
 )
 
+# Local constants.
+SLOW_PASS = [
+    sys.executable, "-c", "import time; time.sleep(0.5); print('slow')"
+]
+FAST_PASS = [sys.executable, "-c", "print('fast')"]
+FAST_FAIL = [sys.executable, "-c", "print('broken'); raise SystemExit(1)"]
+HANG = [sys.executable, "-c", "import time; time.sleep(60)"]
+
 ###########
 # TESTING #
 ###########
@@ -52,3 +75,270 @@ def test_continuous_integration_can_stop_after_lint_failure(
 def test_continuous_integration_reports_test_failure(_linter_mock, _tests_mock):
     """A test failure propagates through the printing wrapper."""
     assert not run_continuous_integration(stop_on_failure=True)
+
+
+def test_parallel_output_is_replayed_in_order(capsys):
+    """Output follows the order of the commands, not of their completion."""
+    assert run_commands_in_parallel([SLOW_PASS, FAST_PASS]) == [True, True]
+    assert capsys.readouterr().out == "slow\nfast\n"
+
+
+def test_parallel_commands_are_timed_separately():
+    """Each command's own wall time, CPU time and peak memory are kept."""
+    usages = []
+    assert run_commands_in_parallel([SLOW_PASS, FAST_PASS], usages=usages)
+    slow_usage, fast_usage = usages
+    assert slow_usage.wall_time >= 0.5 > fast_usage.wall_time
+    assert slow_usage.cpu_time > 0
+    assert slow_usage.peak_rss_kib > 0
+    usages = []
+    run_commands_in_parallel([["/no/such/command"]], usages=usages)
+    assert usages == [None]
+
+
+def test_parallel_failure_cancels_sibling():
+    """Stop-on-failure terminates a stage that is still running."""
+    start = time.monotonic()
+    results = run_commands_in_parallel([FAST_FAIL, HANG], stop_on_failure=True)
+    assert results == [False, False]
+    assert time.monotonic()-start < 30
+
+
+@patch(
+    "source.continuous_integration.get_test_command", return_value=FAST_FAIL
+)
+@patch(
+    "source.continuous_integration.get_linter_command", return_value=FAST_PASS
+)
+def test_continuous_integration_in_parallel(_linter_mock, _tests_mock):
+    """Parallel mode fails when either stage fails."""
+    assert not run_continuous_integration_no_print(parallel=True)
+    assert not run_continuous_integration_no_print(
+        parallel=True, stop_on_failure=True
+    )
+    assert run_commands_in_parallel([FAST_PASS, ["/no/such/command"]]) == [
+        False,
+        False,
+    ]
+    report = CIReport()
+    assert not run_continuous_integration_no_print(parallel=True, report=report)
+    lint_stage, test_stage = report.stages[1:]
+    assert (lint_stage.name, lint_stage.result) == ("lint", True)
+    assert (test_stage.name, test_stage.result) == ("test", False)
+    assert lint_stage.wall_time > 0
+    assert test_stage.peak_rss_kib > 0
+
+
+@patch("source.continuous_integration.get_test_cache_key", return_value="t")
+@patch("source.continuous_integration.get_lint_cache_key", return_value="l")
+@patch("source.continuous_integration.run_tests", return_value=True)
+@patch("source.continuous_integration.run_linter", return_value=True)
+def test_cached_continuous_integration(
+    linter_mock, tests_mock, _lint_key_mock, test_key_mock, tmp_path,
+    monkeypatch
+):
+    """An unchanged tree passes from the cache; a change re-runs its stage."""
+    monkeypatch.chdir(tmp_path)
+    assert run_continuous_integration_no_print(use_cache=True)
+    assert run_continuous_integration_no_print(use_cache=True)
+    assert linter_mock.call_count == tests_mock.call_count == 1
+
+    test_key_mock.return_value = "changed"
+    assert run_continuous_integration_no_print(use_cache=True)
+    assert linter_mock.call_count == 1
+    assert tests_mock.call_count == 2
+
+
+@patch("source.continuous_integration.get_test_cache_key", return_value="t")
+@patch("source.continuous_integration.get_lint_cache_key", return_value="l")
+@patch("source.continuous_integration.run_tests", return_value=True)
+@patch("source.continuous_integration.run_linter", return_value=True)
+def test_partial_runs_are_not_cached(
+    linter_mock, tests_mock, _lint_key_mock, _test_key_mock, tmp_path,
+    monkeypatch
+):
+    """Checking only what changed doesn't count as a pass for the lot."""
+    monkeypatch.chdir(tmp_path)
+    assert run_continuous_integration_no_print(
+        use_cache=True, changed_only=True
+    )
+    assert run_continuous_integration_no_print(use_cache=True)
+    assert linter_mock.call_count == tests_mock.call_count == 2
+    assert linter_mock.call_args.kwargs == tests_mock.call_args.kwargs == {}
+
+
+def test_cache_keys_cover_different_files():
+    """The linter's key ignores files which only the tests can see."""
+    lint_key, test_key = get_lint_cache_key(), get_test_cache_key()
+    assert len(lint_key) == len(test_key) == 64
+    assert lint_key != test_key
+
+
+def test_cache_keys_cover_untracked_files(tmp_path, monkeypatch):
+    """A new, untracked file changes both keys; the cache itself doesn't."""
+    monkeypatch.chdir(tmp_path)
+    subprocess.run(["git", "init", "-q"], check=True)
+    (tmp_path/"ruff.toml").write_text("", encoding="utf-8")
+    (tmp_path/"pytest.ini").write_text("[pytest]\n", encoding="utf-8")
+    lint_key, test_key = get_lint_cache_key(), get_test_cache_key()
+    (tmp_path/".hosker_ci_cache.json").write_text("{}", encoding="utf-8")
+    assert (get_lint_cache_key(), get_test_cache_key()) == (lint_key, test_key)
+    (tmp_path/"b.py").write_text("import os\n", encoding="utf-8")
+    assert get_lint_cache_key() != lint_key
+    assert get_test_cache_key() != test_key
+
+
+def test_changed_only_linting(tmp_path, monkeypatch):
+    """Only changed Python files are linted, unless the config has changed."""
+    monkeypatch.chdir(tmp_path)
+    assert get_changed_files() is None
+    assert get_paths_to_lint() is None
+    git = ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com"]
+    subprocess.run(git+["init", "-q", "-b", "main"], check=True)
+    (tmp_path/"ruff.toml").write_text("", encoding="utf-8")
+    (tmp_path/"old.py").write_text("import os\n", encoding="utf-8")
+    subprocess.run(git+["add", "."], check=True)
+    subprocess.run(git+["commit", "-q", "-m", "Initial"], check=True)
+    subprocess.run(git+["checkout", "-q", "-b", "feature"], check=True)
+
+    assert get_changed_files() == []
+    assert run_linter(changed_only=True)
+
+    (tmp_path/"new.py").write_text("x = 1\n", encoding="utf-8")
+    (tmp_path/"notes.md").write_text("Notes\n", encoding="utf-8")
+    assert get_paths_to_lint() == ["new.py"]
+    assert get_paths_to_lint(base_ref="main") == ["new.py"]
+    assert run_linter(changed_only=True)
+
+    (tmp_path/"ruff.toml").write_text("line-length = 80\n", encoding="utf-8")
+    assert get_paths_to_lint() is None
+    assert not run_linter(changed_only=True)
+
+
+@patch("source.continuous_integration.run_tests", return_value=True)
+@patch(
+    "source.continuous_integration.get_paths_to_tests",
+    return_value=["tests/test_misc.py"]
+)
+@patch("source.continuous_integration.get_paths_to_lint", return_value=[])
+def test_nothing_to_lint_in_parallel(_lint_mock, _tests_paths_mock, tests_mock):
+    """Parallel mode falls back to the tests alone when nothing changed."""
+    assert run_continuous_integration_no_print(
+        parallel=True, changed_only=True
+    )
+    tests_mock.assert_called_once_with(changed_only=True, base_ref=None)
+
+
+def test_changed_only_tests(tmp_path, monkeypatch):
+    """Only the tests which import a changed module are run."""
+    monkeypatch.chdir(tmp_path)
+    git = ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com"]
+    subprocess.run(git+["init", "-q"], check=True)
+    (tmp_path/"tests").mkdir()
+    (tmp_path/"pytest.ini").write_text(
+        "[pytest]\npythonpath = .\ntestpaths = tests\n", encoding="utf-8"
+    )
+    (tmp_path/"one.py").write_text("VALUE = 1\n", encoding="utf-8")
+    (tmp_path/"two.py").write_text("VALUE = 2\n", encoding="utf-8")
+    (tmp_path/"tests"/"test_one.py").write_text(
+        "from one import VALUE\n\ndef test_one():\n    assert VALUE == 1\n",
+        encoding="utf-8"
+    )
+    (tmp_path/"tests"/"test_two.py").write_text(
+        "from two import VALUE\n\ndef test_two():\n    assert VALUE == 2\n",
+        encoding="utf-8"
+    )
+    subprocess.run(git+["add", "."], check=True)
+    subprocess.run(git+["commit", "-q", "-m", "Initial"], check=True)
+
+    assert get_paths_to_tests() == []
+    assert run_tests(changed_only=True)
+    (tmp_path/"two.py").write_text("VALUE = 3\n", encoding="utf-8")
+    assert get_paths_to_tests() == ["tests/test_two.py"]
+    assert not run_tests(changed_only=True)
+    (tmp_path/"three.py").write_text("", encoding="utf-8")
+    assert get_paths_to_tests() is None
+
+
+def test_sharded_tests(tmp_path, monkeypatch, capsys):
+    """Shards merge into one verdict, one summary and recorded durations."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path/"tests").mkdir()
+    (tmp_path/"pytest.ini").write_text(
+        "[pytest]\ntestpaths = tests\n", encoding="utf-8"
+    )
+    for index in range(3):
+        (tmp_path/"tests"/f"test_{index}.py").write_text(
+            f"def test_{index}():\n    assert {index} != 2\n",
+            encoding="utf-8"
+        )
+
+    assert not run_tests(shards=2)
+    assert "3 tests in 2 shards: 1 failed" in capsys.readouterr().out
+    assert len(read_durations()) == 3
+    assert run_sharded_tests(2, paths_to_tests=["tests/test_0.py"]) == [True]
+    assert run_sharded_tests(2, paths_to_tests=["tests/missing.py"]) == [False]
+
+
+def test_sharded_coverage_floor(tmp_path, monkeypatch, capfd):
+    """Sharded runs are held to the coverage floor, on the combined data."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path/"tests").mkdir()
+    (tmp_path/"shared.py").write_text(
+        "def one():\n    return 1\n\ndef two():\n    return 2\n\n"
+        "def three():\n    return 3\n",
+        encoding="utf-8"
+    )
+    for name in ("one", "two"):
+        (tmp_path/"tests"/f"test_{name}.py").write_text(
+            f"from shared import {name}\n\ndef test_{name}():\n"
+            f"    assert {name}()\n",
+            encoding="utf-8"
+        )
+    for floor, expected in ((100, False), (80, True)):
+        (tmp_path/"pytest.ini").write_text(
+            "[pytest]\npythonpath = .\ntestpaths = tests\n"
+            f"addopts = --cov=shared --cov-fail-under={floor}\n",
+            encoding="utf-8"
+        )
+        assert run_tests(shards=2) is expected
+        assert "TOTAL" in capfd.readouterr().out
+    assert (tmp_path/".coverage").exists()
+
+
+@patch(
+    "source.continuous_integration.run_continuous_integration_no_print",
+    return_value=True
+)
+def test_continuous_integration_keeps_its_signature(routine_mock):
+    """The third positional argument is still stop_on_failure."""
+    assert run_continuous_integration(True, True, True)
+    assert routine_mock.call_args.kwargs["stop_on_failure"] is True
+    assert routine_mock.call_args.kwargs["report"] is None
+
+
+@patch("source.continuous_integration.run_sharded_tests", return_value=[True])
+def test_sharded_continuous_integration(sharded_mock):
+    """Sharding and parallel mode combine into one batch of processes."""
+    assert run_continuous_integration_no_print(parallel=True, shards=4)
+    assert sharded_mock.call_args.args == (4,)
+    assert len(sharded_mock.call_args.kwargs["leading_commands"]) == 1
+
+
+@patch("source.continuous_integration.run_tests", return_value=True)
+@patch("source.continuous_integration.run_linter", return_value=True)
+def test_continuous_integration_report(
+    _linter_mock, _tests_mock, tmp_path, monkeypatch
+):
+    """Reporting writes a timing for each stage next to the banner."""
+    monkeypatch.chdir(tmp_path)
+    assert run_continuous_integration(report=True, use_cache=True)
+    written = json.loads((tmp_path/PATH_TO_CI_REPORT).read_text("utf-8"))
+    assert [stage["name"] for stage in written["stages"]] == [
+        "cache",
+        "config",
+        "lint",
+        "test",
+    ]
+    assert (tmp_path/"ruff.toml").exists()
+    assert (tmp_path/"pytest.ini").exists()
@@ -0,0 +1,107 @@
+"""Tests for installing on a fleet of hosts."""
+
+import json
+
+import pytest
+
+from source.fleet import (
+    FleetInstaller,
+    LocalTransport,
+    SSHTransport,
+    Transport,
+    make_remote_command,
+    read_inventory,
+)
+from source.hmss_config import DEFAULT_HMSS_CONFIG
+
+
+def test_fleet_installer(tmp_path):
+    """Each host gets the config, and one failure doesn't stop the rest."""
+    config_path = tmp_path/"hmss_config.json"
+    config_path.write_text(json.dumps(DEFAULT_HMSS_CONFIG), encoding="utf-8")
+    installer = FleetInstaller(
+        ["alpha", "beta", "gamma"],
+        transport=LocalTransport(str(tmp_path/"hosts")),
+        max_workers=2,
+        path_to_config=str(config_path),
+        command=(
+            'test -f ~/hmss_config.json && echo "installed on $HOME" && '
+            '[ "$(basename "$HOME")" != beta ]'
+        ),
+    )
+    assert not installer.run()
+    assert [result.host for result in installer.results] == [
+        "alpha", "beta", "gamma"
+    ]
+    assert [result.success for result in installer.results] == [
+        True, False, True
+    ]
+    assert json.loads(
+        (tmp_path/"hosts"/"gamma"/"hmss_config.json").read_text()
+    ) == DEFAULT_HMSS_CONFIG
+    description = installer.describe()
+    assert "alpha  ok" in description
+    assert "beta   failed" in description
+    assert "installed on" in description.split("beta:")[1]
+    assert "hosts/alpha" in installer.describe(full_output=True)
+
+    config_path.write_text('{"no_such_key": 1}', encoding="utf-8")
+    with pytest.raises(TypeError):
+        installer.run()
+
+
+def test_fleet_config_is_backed_up(tmp_path):
+    """A host's differing config is kept, and a dry run leaves it alone."""
+    config_path = tmp_path/"hmss_config.json"
+    config_path.write_text(json.dumps(DEFAULT_HMSS_CONFIG), encoding="utf-8")
+    host_config_path = tmp_path/"hosts"/"alpha"/"hmss_config.json"
+    host_config_path.parent.mkdir(parents=True)
+    host_config_path.write_text("{}", encoding="utf-8")
+    installer = FleetInstaller(
+        ["alpha"],
+        transport=LocalTransport(str(tmp_path/"hosts")),
+        path_to_config=str(config_path),
+        command="true",
+        dry_run=True,
+    )
+    assert installer.run()
+    assert host_config_path.read_text(encoding="utf-8") == "{}"
+    installer.dry_run = False
+    for _ in range(2):
+        assert installer.run()
+    assert json.loads(host_config_path.read_text()) == DEFAULT_HMSS_CONFIG
+    assert (host_config_path.parent/"hmss_config.json.bak").read_text() == "{}"
+    assert not (host_config_path.parent/"hmss_config.json.tmp").exists()
+    with pytest.raises(TypeError):
+        Transport()
+
+
+def test_unreachable_host(tmp_path):
+    """A transport which can't even start counts as a failure."""
+    config_path = tmp_path/"hmss_config.json"
+    config_path.write_text("{}", encoding="utf-8")
+    installer = FleetInstaller(
+        ["host"],
+        transport=SSHTransport(ssh_options=()),
+        path_to_config=str(config_path),
+    )
+    installer.transport.get_args = lambda host, command: ["/no/such/ssh"]
+    assert not installer.run()
+    assert installer.results[0].returncode is None
+    assert SSHTransport().get_args("me@host", "ls") == [
+        "ssh", "-o", "BatchMode=yes", "me@host", "ls"
+    ]
+
+
+def test_inventory_and_command(tmp_path):
+    """Inventories may be bare lists or objects; flags are appended."""
+    inventory_path = tmp_path/"inventory.json"
+    inventory_path.write_text('["a", "b"]', encoding="utf-8")
+    assert read_inventory(str(inventory_path)) == ["a", "b"]
+    inventory_path.write_text('{"hosts": ["c"]}', encoding="utf-8")
+    assert read_inventory(str(inventory_path)) == ["c"]
+    inventory_path.write_text('{"hosts": [1]}', encoding="utf-8")
+    with pytest.raises(ValueError):
+        read_inventory(str(inventory_path))
+    assert make_remote_command(fresh=False, dry_run=True) == \
+        "install-hmss --native --dry-run"
@@ -3,10 +3,22 @@ This code tests the HMSSConfig class.
 """
 
 # Standard imports.
-from unittest.mock import patch
+from pathlib import Path
+from unittest.mock import call, patch
+
+# Non-standard imports.
+import pytest
 
 # Source imports.
-from source.hm_software_installer import HMSoftwareInstaller
+from source import install_steps
+from source.hm_software_installer import (
+    HMSoftwareInstaller,
+    HMSSError,
+    format_size,
+    run_step_command,
+)
+from source.hmss_config import HMSSConfig
+from source.install_steps import DONE, SKIPPED, UNCHANGED, StepJournal
 
 ###########
 # TESTING #
@@ -38,3 +50,215 @@ def test_hm_software_installer(tmp_path):
         ):
             assert not installer_obj.run()
         assert not script_path.exists()
+
+
+def test_native_installer(tmp_path, capsys):
+    """ Test that the native engine runs each step, skipping present repos. """
+    (tmp_path/"already_here").mkdir()
+    config = HMSSConfig(
+        essential_apt_packages=["git"],
+        non_essential_apt_packages=[],
+        royal_repos=["already_here", "new_repo"],
+        clone_method="ssh",
+        git_host="example.com",
+        git_account_name="someone"
+    )
+    with (
+        patch("source.hm_software_installer.PATH_TO_HOME", str(tmp_path)),
+        patch(
+            "source.hm_software_installer.run_step_command", return_value=True
+        ) as command_mock,
+        patch(
+            "source.hm_software_installer.run_apt_install", return_value=True
+        ) as apt_mock,
+        patch("source.hm_software_installer.SSHSession") as session_mock
+    ):
+        session = session_mock.return_value.__enter__.return_value
+        session.get_git_env.return_value = {"GIT_SSH_COMMAND": "shared"}
+        session.describe.return_value = "Shared one SSH connection."
+        installer_obj = HMSoftwareInstaller(config=config, native=True)
+        assert installer_obj.run()
+    session_mock.assert_called_once_with("git@example.com")
+    session.note.assert_called_once_with("clone")
+    assert call(
+        ["git", "clone", "git@example.com:someone/new_repo"],
+        cwd=str(tmp_path),
+        env={"GIT_SSH_COMMAND": "shared"}
+    ) in command_mock.call_args_list
+    output = capsys.readouterr().out
+    assert "Shared one SSH connection." in output
+    apt_mock.assert_called_once_with(["git"], raise_error=False)
+    commands = [call.args[0] for call in command_mock.call_args_list]
+    assert ["git", "clone", "git@example.com:someone/new_repo"] in commands
+    assert ["git", "clone", "git@example.com:someone/already_here"] \
+        not in commands
+    assert commands[0] == ["sudo", "-v"]
+    assert all(step.status == DONE for step in installer_obj.steps)
+    assert "[done] clone new_repo" in output
+
+    assert not Path(install_steps.PATH_TO_INSTALL_JOURNAL).exists()
+
+def test_native_installer_failure(tmp_path):
+    """ Test that a failed APT step stops later APT steps, but not clones. """
+    config = HMSSConfig(
+        essential_apt_packages=["git"],
+        royal_repos=["repo"],
+        clone_method="https"
+    )
+    with (
+        patch("source.hm_software_installer.PATH_TO_HOME", str(tmp_path)),
+        patch(
+            "source.hm_software_installer.run_step_command", return_value=True
+        ),
+        patch(
+            "source.hm_software_installer.run_apt_install", return_value=False
+        )
+    ):
+        installer_obj = HMSoftwareInstaller(config=config, native=True)
+        assert not installer_obj.run()
+    statuses = {step.name: step.status for step in installer_obj.steps}
+    assert statuses["non-essential apt packages"] == SKIPPED
+    assert statuses["clone repo"] == DONE
+    assert statuses["wallpaper"] == DONE
+
+    with (
+        patch("source.hm_software_installer.PATH_TO_HOME", str(tmp_path)),
+        patch(
+            "source.hm_software_installer.run_step_command", return_value=True
+        ) as command_mock,
+        patch(
+            "source.hm_software_installer.run_apt_install", return_value=True
+        )
+    ):
+        assert installer_obj.run()
+    statuses = {step.name: step.status for step in installer_obj.steps}
+    assert statuses["apt update"] == DONE
+    assert statuses["clone repo"] == statuses["wallpaper"] == UNCHANGED
+    assert ["sudo", "apt-get", "update"] in \
+        [call.args[0] for call in command_mock.call_args_list]
+    assert not Path(install_steps.PATH_TO_INSTALL_JOURNAL).exists()
+    installer_obj.config.clone_method = "carrier pigeon"
+    with pytest.raises(HMSSError):
+        installer_obj.run()
+
+def test_native_installer_clone_options(tmp_path, capsys):
+    """ Test that the clones obey the config's pool size and options. """
+    config = HMSSConfig(
+        royal_repos=["one", "two", "three"],
+        clone_method="https",
+        git_host="example.com",
+        git_account_name="someone",
+        clone_max_workers=2,
+        clone_filter="blob:none",
+        clone_depth=1
+    )
+    with (
+        patch("source.hm_software_installer.PATH_TO_HOME", str(tmp_path)),
+        patch(
+            "source.hm_software_installer.run_step_command", return_value=True
+        ) as command_mock,
+        patch("source.hm_software_installer.StepEngine") as engine_mock
+    ):
+        installer_obj = HMSoftwareInstaller(config=config, native=True)
+        installer_obj.run()
+        assert engine_mock.call_args.kwargs["pool_limits"] == {"clone": 2}
+        assert installer_obj._clone_royal("one")
+    assert command_mock.call_args.args[0] == [
+        "git",
+        "clone",
+        "--filter=blob:none",
+        "--depth",
+        "1",
+        "https://example.com/someone/one"
+    ]
+    clones = [step for step in installer_obj.steps if step.pool == "clone"]
+    assert len(clones) == 3
+    installer_obj._report_step(clones[0])
+    assert "finished" not in capsys.readouterr().out
+    clones[0].status = DONE
+    installer_obj._report_step(clones[0])
+    assert "1 of 11 steps finished" in capsys.readouterr().out
+
+def test_clones_overlap_with_apt(tmp_path):
+    """
+    Test that clones wait only for Git, which comes before other APT work.
+    """
+    config = HMSSConfig(
+        essential_apt_packages=["vlc"],
+        royal_repos=["repo"],
+        clone_method="https"
+    )
+    installer_obj = HMSoftwareInstaller(config=config, native=True)
+    steps = {step.name: step for step in installer_obj._build_steps()}
+    assert steps["clone repo"].depends_on == ("git",)
+    assert steps["git"].depends_on == ("apt update",)
+    assert steps["apt upgrade"].depends_on == ("git",)
+    with (
+        patch("shutil.which", return_value="/usr/bin/git"),
+        patch(
+            "source.hm_software_installer.run_apt_install", return_value=True
+        ) as apt_mock
+    ):
+        assert installer_obj._install_git()
+        apt_mock.assert_not_called()
+    with (
+        patch("shutil.which", return_value=None),
+        patch(
+            "source.hm_software_installer.run_apt_install", return_value=True
+        ) as apt_mock
+    ):
+        assert installer_obj._install_git()
+    apt_mock.assert_called_once_with(["git"], raise_error=False)
+
+def test_plan(tmp_path):
+    """ Test that planning reports what to do, and does none of it. """
+    (tmp_path/"already_here").mkdir()
+    config = HMSSConfig(
+        essential_apt_packages=["git", "vlc"],
+        non_essential_apt_packages=["vlc", "gimp", "inkscape"],
+        royal_repos=["already_here", "new_repo"],
+        clone_method="https",
+        path_to_wallpaper_file="/wallpaper.png"
+    )
+    with (
+        patch("source.hm_software_installer.PATH_TO_HOME", str(tmp_path)),
+        patch(
+            "source.hm_software_installer.get_installed_apt_packages",
+            return_value={"git"}
+        ) as installed_mock,
+        patch(
+            "source.hm_software_installer.get_apt_download_sizes",
+            return_value={"vlc": 2_000_000, "gimp": 500}
+        ),
+        patch("source.hm_software_installer.run_step_command") as command_mock,
+        patch("source.hm_software_installer.run_apt_install") as apt_mock
+    ):
+        plan = HMSoftwareInstaller(config=config).plan()
+        assert plan.missing_apt_packages == ["vlc", "gimp", "inkscape"]
+        assert plan.repos_to_clone == ["new_repo"]
+        assert plan.get_download_size() == 2_000_500
+        description = plan.describe()
+        assert "about 2.0 MB, plus unknown sizes for: inkscape" in description
+        assert "Repos to clone: new_repo" in description
+        assert "/wallpaper.png" in description
+        assert not plan.unchanged_steps
+
+        installer_obj = HMSoftwareInstaller(config=config, native=True)
+        with patch.object(StepJournal, "has_done", return_value=True):
+            plan = installer_obj.plan()
+        assert "wallpaper" in plan.unchanged_steps
+        assert "Steps to skip" in plan.describe()
+    installed_mock.assert_called_with(["git", "vlc", "gimp", "inkscape"])
+    command_mock.assert_not_called()
+    apt_mock.assert_not_called()
+    assert not installer_obj.steps
+    assert format_size(999) == "999 B"
+    assert format_size(3_500_000_000) == "3.5 GB"
+
+def test_run_step_command(capsys):
+    """ Test that output is held back unless the command fails. """
+    assert run_step_command(["git", "--version"])
+    assert capsys.readouterr().out == ""
+    assert not run_step_command(["git", "no-such-command"])
+    assert "failed" in capsys.readouterr().out
+    assert not run_step_command(["/no/such/command"])
@@ -0,0 +1,70 @@
+"""Tests for the map from source files to the tests which they affect."""
+
+from unittest.mock import patch
+
+from source.impact_map import (
+    ImpactMap,
+    get_module_names,
+    read_imports,
+)
+
+FILES = {
+    "pkg/__init__.py": "",
+    "pkg/a.py": "from .b import helper\n",
+    "pkg/b.py": "def helper():\n    pass\n",
+    "pkg/c.py": "import json\n",
+    "tests/test_a.py": "from pkg.a import helper\n",
+    "tests/test_b.py": "import pkg.b\n",
+    "tests/conftest.py": "",
+}
+
+
+def make_tree(tmp_path, monkeypatch):
+    """Write out a small package with its tests, and map it."""
+    monkeypatch.chdir(tmp_path)
+    for path, contents in FILES.items():
+        (tmp_path/path).parent.mkdir(exist_ok=True)
+        (tmp_path/path).write_text(contents, encoding="utf-8")
+    result = ImpactMap()
+    result.refresh(sorted(FILES)+["pkg/deleted.py"])
+    return result
+
+
+def test_module_names_and_imports(tmp_path, monkeypatch):
+    """Relative imports resolve against the importing file's package."""
+    make_tree(tmp_path, monkeypatch)
+    assert get_module_names("pkg/__init__.py") == ["pkg"]
+    assert get_module_names("src/pkg/a.py") == ["src.pkg.a", "pkg.a"]
+    assert read_imports("pkg/a.py") == ["pkg.b", "pkg.b.helper"]
+    (tmp_path/"broken.py").write_text("import (", encoding="utf-8")
+    assert read_imports("broken.py") == []
+
+
+def test_select_tests(tmp_path, monkeypatch):
+    """Changes select their dependent tests, and misses select everything."""
+    impact_map = make_tree(tmp_path, monkeypatch)
+    assert "pkg/deleted.py" not in impact_map.files
+    assert impact_map.select_tests(["pkg/b.py"]) == [
+        "tests/test_a.py",
+        "tests/test_b.py",
+    ]
+    assert impact_map.select_tests(["pkg/a.py", "NOTES.md"]) == [
+        "tests/test_a.py"
+    ]
+    assert impact_map.select_tests(["tests/test_b.py"]) == ["tests/test_b.py"]
+    assert impact_map.select_tests(["NOTES.md"]) == []
+    assert impact_map.select_tests(["pkg/c.py"]) is None
+    assert impact_map.select_tests(["tests/conftest.py"]) is None
+
+
+def test_impact_map_persists(tmp_path, monkeypatch):
+    """Only files touched since the last run are parsed again."""
+    impact_map = make_tree(tmp_path, monkeypatch)
+    assert ImpactMap.read().files == {}
+    impact_map.write()
+
+    reread = ImpactMap.read()
+    assert reread.files == impact_map.files
+    with patch("source.impact_map.read_imports") as read_mock:
+        reread.refresh(sorted(FILES))
+    read_mock.assert_not_called()
@@ -1,13 +1,17 @@
 """Tests for dependency installation helpers."""
 
-from subprocess import CalledProcessError
+from subprocess import CalledProcessError, CompletedProcess
 from unittest.mock import call, patch
 
 from source.install_dependencies import (
+    build_wheelhouse,
+    get_apt_download_sizes,
+    get_installed_apt_packages,
     install_apt_package,
     install_apt_packages,
     install_dependencies,
     install_dependency,
+    is_satisfied,
 )
 
 
@@ -54,3 +58,109 @@ def test_install_apt_packages_is_quiet_per_package(install_mock):
         call("one", quiet=True),
         call("two", quiet=True),
     ]
+
+
+@patch("source.install_dependencies.subprocess.run")
+def test_install_dependencies_in_batch(run_mock, capsys):
+    """A batch is one pip call, and a failed batch names the culprits."""
+    assert install_dependencies(["one", "two"], batch=True)
+    run_mock.assert_called_once_with(
+        ["pip", "install", "one", "two"], check=True
+    )
+
+    def fail_on_two(args, check):
+        if "two" in args:
+            raise CalledProcessError(1, "pip")
+
+    run_mock.side_effect = fail_on_two
+    assert not install_dependencies(["one", "two"], batch=True)
+    assert "Failed to install: two" in capsys.readouterr().out
+
+    run_mock.side_effect = lambda args, check: (
+        fail_on_two(args, check) if len(args) > 3 else None
+    )
+    assert not install_dependencies(["one", "two"], batch=True)
+    assert "conflicting requirements" in capsys.readouterr().out
+
+
+@patch("source.install_dependencies.subprocess.run")
+def test_install_apt_packages_in_batch(run_mock, capsys):
+    """Installed packages are skipped, and the rest share one transaction."""
+    run_mock.return_value = CompletedProcess(
+        [], 1, stdout="one installed\ntwo not-installed\n"
+    )
+
+    assert install_apt_packages(["one", "two", "three"], batch=True)
+    assert run_mock.call_args_list[-1] == call(
+        ["sudo", "apt-get", "install", "--yes", "two", "three"], check=True
+    )
+    output = capsys.readouterr().out
+    assert "Newly installed: two, three" in output
+    assert "Skipped, as already installed: one" in output
+
+    run_mock.reset_mock()
+    assert install_apt_packages(["one"], batch=True, quiet=True)
+    run_mock.assert_called_once()
+
+    run_mock.side_effect = OSError
+    assert get_installed_apt_packages(["one"]) == set()
+    assert not install_apt_packages(["one"], batch=True, raise_error=False)
+
+
+@patch("source.install_dependencies.subprocess.run")
+def test_get_apt_download_sizes(run_mock):
+    """Sizes come from the APT cache, skipping packages without one."""
+    run_mock.return_value = CompletedProcess(
+        [],
+        100,
+        stdout=(
+            "Package: one\nVersion: 1\nSize: 1234\n"
+            "Description: a: thing\n text: more\n\n"
+            "Package: two\nVersion: 2\n\n"
+        ),
+    )
+    assert get_apt_download_sizes(["one", "two", "three"]) == {"one": 1234}
+    assert run_mock.call_args.args[0] == [
+        "apt-cache", "show", "--no-all-versions", "one", "two", "three"
+    ]
+
+    run_mock.side_effect = OSError
+    assert get_apt_download_sizes(["one"]) == {}
+
+
+@patch("source.install_dependencies.subprocess.run")
+def test_satisfied_dependencies_skip_pip(run_mock):
+    """Requirements met by installed metadata never reach pip."""
+    assert is_satisfied("pytest>=1")
+    assert is_satisfied("pytest; python_version < '3'")
+    assert not is_satisfied("pytest<1")
+    assert not is_satisfied("pytest[testing]")
+    assert not is_satisfied("no-such-package-hopefully")
+    assert not is_satisfied("not a requirement!")
+
+    assert install_dependency("pytest>=1")
+    assert install_dependencies(["pytest", "termcolor"], batch=True)
+    run_mock.assert_not_called()
+
+
+@patch("source.install_dependencies.subprocess.run")
+def test_wheelhouse(run_mock):
+    """Wheels are built into, and installed from, a local directory alone."""
+    assert build_wheelhouse(["one"], "wheels", ["requirements.txt"])
+    run_mock.assert_called_once_with(
+        [
+            "pip", "wheel", "--wheel-dir", "wheels",
+            "--requirement", "requirements.txt", "one",
+        ],
+        check=True,
+    )
+
+    run_mock.reset_mock()
+    assert install_dependencies(["one"], path_to_wheelhouse="wheels")
+    run_mock.assert_called_once_with(
+        ["pip", "install", "--no-index", "--find-links", "wheels", "one"],
+        check=True,
+    )
+
+    run_mock.side_effect = CalledProcessError(1, "pip")
+    assert not build_wheelhouse(["one"], "wheels")
@@ -0,0 +1,153 @@
+"""Tests for the installation step engine."""
+
+import threading
+import time
+
+import pytest
+
+from source.install_steps import (
+    DONE,
+    FAILED,
+    SKIPPED,
+    UNCHANGED,
+    Step,
+    StepEngine,
+    StepError,
+    StepJournal,
+    fingerprint_steps,
+)
+
+
+def test_independent_steps_run_side_by_side():
+    """Two steps with no dependency between them overlap in time."""
+    barrier = threading.Barrier(2, timeout=5)
+    order = []
+
+    def meet(name):
+        barrier.wait()
+        order.append(name)
+        return True
+
+    steps = [
+        Step("first", lambda: meet("first")),
+        Step("second", lambda: meet("second")),
+        Step("last", lambda: order.append("last") or True, ("first", "second")),
+    ]
+    engine = StepEngine(steps, max_workers=2)
+    assert engine.run()
+    assert order[-1] == "last"
+    assert all(step.duration is not None for step in steps)
+    assert "last" in engine.describe()
+
+
+def test_failure_skips_dependents():
+    """A failed or crashing step stops only the steps which need it."""
+    def explode():
+        raise RuntimeError("boom")
+
+    steps = [
+        Step("fails", lambda: False),
+        Step("crashes", explode),
+        Step("needs fails", lambda: True, ("fails",)),
+        Step("needs needs fails", lambda: True, ("needs fails",)),
+        Step("independent", lambda: True),
+    ]
+    seen = []
+    engine = StepEngine(steps, on_change=lambda step: seen.append(step.name))
+    assert not engine.run()
+    assert [step.status for step in steps] == [
+        FAILED, FAILED, SKIPPED, SKIPPED, DONE
+    ]
+    assert "boom" in steps[1].error
+    assert "needs needs fails" in seen
+
+
+def test_bad_step_graphs_are_rejected():
+    """Duplicates, unknown dependencies and cycles are caught up front."""
+    with pytest.raises(StepError):
+        StepEngine([Step("a", bool), Step("a", bool)])
+    with pytest.raises(StepError):
+        StepEngine([Step("a", bool, ("b",))])
+    with pytest.raises(StepError):
+        StepEngine([Step("a", bool, ("b",)), Step("b", bool, ("a",))])
+
+
+def test_fingerprints_cascade_downstream():
+    """A step's fingerprint covers its inputs and its dependencies'."""
+    steps = [
+        Step("needed", bool, inputs=1),
+        Step("needs", bool, ("needed",), inputs=2),
+        Step("untracked", bool),
+    ]
+    fingerprint_steps(steps)
+    first = [step.fingerprint for step in steps]
+    assert first[0] and first[1] and first[2] is None
+    steps[0].inputs = 3
+    fingerprint_steps(steps)
+    assert steps[1].fingerprint != first[1]
+    with pytest.raises(StepError):
+        fingerprint_steps([Step("a", bool, ("b",))])
+
+
+def test_journal_resumes_where_a_run_failed():
+    """Finished, unchanged steps are skipped; changed inputs cascade."""
+    calls = []
+    flaky = {"works": False}
+
+    def make_steps(package):
+        return [
+            Step("always", lambda: calls.append("always") or True),
+            Step("update", lambda: calls.append("update") or True, inputs=[]),
+            Step(
+                "upgrade",
+                lambda: calls.append("upgrade") or flaky["works"],
+                ("update",),
+                inputs=[],
+            ),
+            Step(
+                "install",
+                lambda: calls.append("install") or True,
+                ("upgrade",),
+                inputs=[package],
+            ),
+        ]
+
+    assert not StepEngine(make_steps("vlc"), journal=StepJournal()).run()
+    assert calls == ["always", "update", "upgrade"]
+
+    calls.clear()
+    flaky["works"] = True
+    steps = make_steps("vlc")
+    assert StepEngine(steps, journal=StepJournal.read()).run()
+    assert sorted(calls) == ["always", "install", "upgrade"]
+    assert steps[1].status == UNCHANGED
+
+    calls.clear()
+    assert StepEngine(make_steps("vlc"), journal=StepJournal.read()).run()
+    assert calls == ["always"]
+
+    calls.clear()
+    assert StepEngine(make_steps("gimp"), journal=StepJournal.read()).run()
+    assert sorted(calls) == ["always", "install"]
+
+
+def test_pool_limits_how_many_steps_run_at_once():
+    """Steps in a limited pool never exceed the limit, unlike the rest."""
+    lock = threading.Lock()
+    counts = {"now": 0, "most": 0}
+
+    def clone():
+        with lock:
+            counts["now"] += 1
+            counts["most"] = max(counts["most"], counts["now"])
+        time.sleep(0.05)
+        with lock:
+            counts["now"] -= 1
+        return True
+
+    steps = [Step(f"clone {index}", clone, pool="clone") for index in range(6)]
+    steps.append(Step("other", lambda: True))
+    engine = StepEngine(steps, max_workers=6, pool_limits={"clone": 2})
+    assert engine.run()
+    assert counts["most"] == 2
+    assert all(step.status == DONE for step in steps)
@@ -0,0 +1,66 @@
+"""Tests for the shared, queue-based logging pipeline."""
+
+import logging
+import queue
+from unittest.mock import patch
+
+from source.hmss_config import HMSSConfig
+from source.log_pipeline import (
+    DroppingQueueHandler,
+    close_log_pipelines,
+    get_logger,
+)
+from source.royal_repos_backup import RoyalReposBackup
+
+
+def test_instances_share_one_pipeline(tmp_path):
+    """However many backups we make, each log file gets one handler."""
+    log_path = tmp_path/"hm_git.log"
+    config = HMSSConfig(royal_repos=[])
+    with patch("source.royal_repos_backup.PATH_TO_LOG", str(log_path)):
+        loggers = {
+            id(RoyalReposBackup(config=config).logger) for _ in range(50)
+        }
+        backup_obj = RoyalReposBackup(config=config)
+        assert backup_obj.back_up_all()
+    assert len(loggers) == 1
+    assert len(backup_obj.logger.handlers) == 1
+    close_log_pipelines()
+    assert not backup_obj.logger.handlers
+    assert "Backed up royal repos successfully." in log_path.read_text()
+
+
+def test_log_file_rotates(tmp_path):
+    """The log file is capped in size, with a few old copies kept."""
+    log_path = tmp_path/"test.log"
+    with (
+        patch("source.log_pipeline.MAX_LOG_BYTES", 1000),
+        patch("source.log_pipeline.LOG_BACKUP_COUNT", 2),
+    ):
+        logger = get_logger(str(log_path))
+        for index in range(200):
+            logger.info("Line number %s", index)
+        close_log_pipelines()
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "test.log", "test.log.1", "test.log.2"
+    ]
+    assert log_path.stat().st_size <= 1000
+    assert "Line number 199" in log_path.read_text()
+
+
+def test_full_queue_drops_records():
+    """A backed-up queue costs us records, not a blocked worker."""
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    record = logging.makeLogRecord({"msg": "hello"})
+    handler.enqueue(record)
+    handler.enqueue(record)
+    assert handler.dropped == 1
+
+
+def test_dropped_records_are_counted_in_the_log(tmp_path):
+    """Closing the pipeline records how many records were lost."""
+    log_path = tmp_path/"test.log"
+    logger = get_logger(str(log_path))
+    logger.handlers[0].dropped = 3
+    close_log_pipelines()
+    assert "WARNING | Dropped 3 log records" in log_path.read_text()
@@ -0,0 +1,61 @@
+"""Tests for discovering, and indexing, the Git repos under some roots."""
+
+import shutil
+import subprocess
+
+from source.repo_discovery import RepoIndex, discover_repos
+
+
+def make_repo(path, remote=None):
+    """Make an empty repo, with an origin remote if given."""
+    path.mkdir(parents=True)
+    subprocess.run(["git", "init", "-q", str(path)], check=True)
+    if remote:
+        subprocess.run(
+            ["git", "remote", "add", "origin", remote], check=True, cwd=path
+        )
+
+
+def test_discover_repos(tmp_path):
+    """Repos are found, but not inside repos, hidden folders or too deep."""
+    make_repo(tmp_path/"one", "git@github.com:me/one")
+    make_repo(tmp_path/"one"/"vendored")
+    make_repo(tmp_path/"work"/"two")
+    make_repo(tmp_path/".cache"/"hidden")
+    make_repo(tmp_path/"a"/"b"/"c"/"d"/"too_deep")
+    assert discover_repos(str(tmp_path)) == [
+        {"path": str(tmp_path/"one"), "remote": "git@github.com:me/one"},
+        {"path": str(tmp_path/"work"/"two"), "remote": None},
+    ]
+
+
+def test_repo_index(tmp_path):
+    """The index walks each root only when stale, and filters by remote."""
+    make_repo(tmp_path/"root"/"mine", "git@github.com:me/mine")
+    make_repo(tmp_path/"root"/"theirs", "https://gitlab.com/them/theirs")
+    make_repo(tmp_path/"root"/"local_only")
+    root = str(tmp_path/"root")
+    index = RepoIndex()
+    assert index.refresh([root], max_age=60, now=1000)
+    index.write()
+
+    index = RepoIndex.read()
+    assert not index.refresh([root], max_age=60, now=1059)
+    assert index.is_stale(root, 60, now=1060)
+    assert index.get_repos() == [
+        str(tmp_path/"root"/"mine"), str(tmp_path/"root"/"theirs")
+    ]
+    assert index.get_repos(["https://gitlab.com/them"]) == [
+        str(tmp_path/"root"/"theirs")
+    ]
+
+    shutil.rmtree(tmp_path/"root"/"mine")
+    assert index.get_repos() == [str(tmp_path/"root"/"theirs")]
+    assert index.refresh([], max_age=60, now=1059)
+    assert index.roots == {}
+
+
+def test_mangled_repo_index_starts_afresh(tmp_path):
+    """A corrupt index costs us a tree walk, not a crash."""
+    (tmp_path/"hm_git_repo_index.json").write_text("[", encoding="utf-8")
+    assert RepoIndex.read().roots == {}
@@ -3,10 +3,56 @@ This code tests the RoyalRoyalReposBackup class.
 """
 
 # Standard imports.
+import subprocess
+import time
+from functools import partial
+from pathlib import Path
 from unittest.mock import patch
 
 # Source imports.
-from source.royal_repos_backup import RoyalReposBackup
+from source.backup_state import BackupState, backup_lock
+from source.hmss_config import HMSSConfig
+from source.log_pipeline import close_log_pipelines
+from source.royal_repos_backup import (
+    AHEAD,
+    DIVERGED,
+    NO_UPSTREAM,
+    UP_TO_DATE,
+    UPDATED,
+    RoyalReposBackup,
+)
+from source.ssh_session import SSHSession
+
+# Local constants.
+GIT_IDENTITY = ("-c", "user.name=Test", "-c", "user.email=test@example.com")
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def git(*args, cwd):
+    """ Run a Git command quietly in a given directory. """
+    subprocess.run(
+        ["git", *GIT_IDENTITY, *args], check=True, cwd=cwd, capture_output=True
+    )
+
+def commit(repo, filename):
+    """ Commit a new file to a given repo. """
+    (repo/filename).write_text(filename, encoding="utf-8")
+    git("add", filename, cwd=repo)
+    git("commit", "-m", filename, cwd=repo)
+
+def make_clones(tmp_path):
+    """ Make an upstream repo, plus a local clone and a collaborator's. """
+    upstream = tmp_path/"upstream.git"
+    git("init", "--bare", str(upstream), cwd=tmp_path)
+    seed = tmp_path/"seed"
+    git("clone", str(upstream), str(seed), cwd=tmp_path)
+    commit(seed, "first")
+    git("push", "origin", "HEAD", cwd=seed)
+    local = tmp_path/"local"
+    git("clone", str(upstream), str(local), cwd=tmp_path)
+    return seed, local
 
 ###########
 # TESTING #
@@ -21,8 +67,247 @@ def test_royal_repos_backup(tmp_path):
         patch("source.royal_repos_backup.PATH_TO_LOG", str(log_path))
     ):
         assert not RoyalReposBackup(human_interface=True).back_up_all()
-        backup_obj = RoyalReposBackup()
+        backup_obj = RoyalReposBackup(incremental=False)
         with patch.object(
             RoyalReposBackup, "_run_git_command", return_value=True
         ):
             assert backup_obj.back_up_all()
+
+def test_concurrent_backup_reports_in_order(tmp_path):
+    """ Test that concurrent backups log their results in config order. """
+    log_path = tmp_path/"hm_git.log"
+    config = HMSSConfig(royal_repos=["slow", "fast", "middling"])
+    delays = {"slow": 0.2, "fast": 0.0, "middling": 0.1}
+
+    def fake_git_command(_self, command, git_directory, errors):
+        repo_name = Path(git_directory).name
+        time.sleep(delays[repo_name])
+        errors.append(f"git {command} failed for {repo_name}")
+        return False
+
+    with (
+        patch("source.royal_repos_backup.PATH_TO_LOG", str(log_path)),
+        patch.object(RoyalReposBackup, "_run_git_command", fake_git_command)
+    ):
+        backup_obj = RoyalReposBackup(config=config, max_workers=3)
+        assert backup_obj._get_max_workers() == 3
+        assert not backup_obj.back_up_all()
+    close_log_pipelines()
+    failed = [
+        line.rsplit(" ", 1)[-1]
+        for line in log_path.read_text(encoding="utf-8").splitlines()
+        if "Error backing up:" in line
+    ]
+    assert failed == ["slow", "fast", "middling"]
+
+def test_incremental_backup_states(tmp_path):
+    """ Test that each incremental state is detected from a single fetch. """
+    seed, local = make_clones(tmp_path)
+    config = HMSSConfig(royal_repos=[str(local)])
+    with patch(
+        "source.royal_repos_backup.PATH_TO_LOG", str(tmp_path/"hm_git.log")
+    ):
+        backup_obj = RoyalReposBackup(config=config)
+        assert backup_obj._back_up_repo(str(local)).state == UP_TO_DATE
+        commit(seed, "second")
+        git("push", "origin", "HEAD", cwd=seed)
+        assert backup_obj._back_up_repo(str(local)).state == UPDATED
+        assert (local/"second").exists()
+        commit(local, "third")
+        assert backup_obj._back_up_repo(str(local)).state == AHEAD
+        commit(seed, "fourth")
+        git("push", "origin", "HEAD", cwd=seed)
+        result = backup_obj._back_up_repo(str(local))
+        assert result.state == DIVERGED
+        assert not result.success
+        assert not backup_obj.back_up_one(str(local))
+
+def test_git_errors_say_why(tmp_path):
+    """ Test that a failed Git command's own explanation is recorded. """
+    errors = []
+    with patch(
+        "source.royal_repos_backup.PATH_TO_LOG", str(tmp_path/"hm_git.log")
+    ):
+        backup_obj = RoyalReposBackup(config=HMSSConfig(royal_repos=[]))
+        assert backup_obj._read_git_output("fetch", str(tmp_path), errors) \
+            is None
+    assert len(errors) == 1
+    assert "not a git repository" in errors[0]
+
+def test_recently_synced_repos_are_skipped(tmp_path):
+    """ Test that a repeat run within the minimum interval is a no-op. """
+    _, local = make_clones(tmp_path)
+    config = HMSSConfig(royal_repos=[str(local)], backup_min_interval=3600)
+    with patch(
+        "source.royal_repos_backup.PATH_TO_LOG", str(tmp_path/"hm_git.log")
+    ):
+        backup_obj = RoyalReposBackup(config=config)
+        assert backup_obj.back_up_all()
+        assert BackupState.read().repos[str(local)]["head"]
+        with patch.object(RoyalReposBackup, "_back_up_repo") as back_up_mock:
+            assert backup_obj.back_up_all()
+            with backup_lock():
+                assert backup_obj.back_up_all()
+        back_up_mock.assert_not_called()
+
+def test_repos_discovered_under_roots_are_backed_up(tmp_path):
+    """ Test that repos found under the roots are synced, by remote. """
+    _, local = make_clones(tmp_path)
+    (tmp_path/"stray").mkdir()
+    git("init", cwd=tmp_path/"stray")
+    config = HMSSConfig(
+        royal_repos=[],
+        backup_roots=[str(tmp_path)],
+        backup_remotes=[str(tmp_path/"upstream.git")]
+    )
+    with patch(
+        "source.royal_repos_backup.PATH_TO_LOG", str(tmp_path/"hm_git.log")
+    ):
+        backup_obj = RoyalReposBackup(config=config)
+        assert backup_obj._get_repo_names() == \
+            [str(local), str(tmp_path/"seed")]
+        assert backup_obj.back_up_all()
+        assert str(local) in BackupState.read().repos
+        with patch(
+            "source.repo_discovery.discover_repos", return_value=[]
+        ) as discover_mock:
+            backup_obj._get_repo_names()
+            discover_mock.assert_not_called()
+            backup_obj.rediscover = True
+            assert backup_obj._get_repo_names() == []
+        discover_mock.assert_called_once_with(str(tmp_path))
+
+def test_repos_without_upstream_are_skipped(tmp_path):
+    """ Test that local-only repos and branches don't fail every backup. """
+    _, local = make_clones(tmp_path)
+    (tmp_path/"stray").mkdir()
+    git("init", cwd=tmp_path/"stray")
+    git("checkout", "-b", "feature", cwd=local)
+    config = HMSSConfig(royal_repos=[], backup_roots=[str(tmp_path)])
+    with patch(
+        "source.royal_repos_backup.PATH_TO_LOG", str(tmp_path/"hm_git.log")
+    ):
+        backup_obj = RoyalReposBackup(config=config)
+        assert str(tmp_path/"stray") not in backup_obj._get_repo_names()
+        result = backup_obj._back_up_repo(str(local))
+        assert result.state == NO_UPSTREAM
+        assert result.success
+        assert not result.errors
+        assert backup_obj.back_up_all()
+
+def test_state_can_be_kept_in_memory(tmp_path):
+    """ Test that a long-lived backup object reads the state file once. """
+    config = HMSSConfig(royal_repos=[])
+    with patch(
+        "source.royal_repos_backup.PATH_TO_LOG", str(tmp_path/"hm_git.log")
+    ):
+        backup_obj = RoyalReposBackup(config=config, keep_state=True)
+        assert backup_obj.back_up_all()
+        with patch.object(BackupState, "read") as read_mock:
+            assert backup_obj.back_up_all()
+        read_mock.assert_not_called()
+
+def test_precheck_skips_needless_fetches(tmp_path):
+    """ Test that a repo whose upstream hasn't moved isn't fetched. """
+    seed, local = make_clones(tmp_path)
+    config = HMSSConfig(royal_repos=[str(local)], backup_precheck=True)
+    with patch(
+        "source.royal_repos_backup.PATH_TO_LOG", str(tmp_path/"hm_git.log")
+    ):
+        backup_obj = RoyalReposBackup(config=config)
+        assert backup_obj.precheck
+        with patch.object(
+            RoyalReposBackup, "_fetch_royal", return_value=False
+        ) as fetch_mock:
+            result = backup_obj._back_up_repo(str(local))
+        fetch_mock.assert_not_called()
+        assert result.state == UP_TO_DATE
+        assert not result.fetched
+
+        commit(seed, "second")
+        git("push", "origin", "HEAD", cwd=seed)
+        result = backup_obj._back_up_repo(str(local))
+        assert result.state == UPDATED
+        assert result.fetched
+
+        git("checkout", "--detach", cwd=local)
+        assert backup_obj._upstream_has_moved(str(local))
+        assert not RoyalReposBackup(config=config, precheck=False).precheck
+        assert not RoyalReposBackup(config=HMSSConfig()).precheck
+
+def test_ssh_connections_are_shared(tmp_path):
+    """
+    Test that SSH users share one connection for the whole run, between those
+    repos whose remote is on the Git host.
+    """
+    fake_ssh = tmp_path/"ssh"
+    fake_ssh.write_text(
+        f'#!/bin/sh\necho "$@" >> {tmp_path/"ssh_calls"}\n', encoding="utf-8"
+    )
+    fake_ssh.chmod(0o755)
+    remote_urls = {
+        "near": "git@example.com:near.git",
+        "far": "git@elsewhere.com:far.git"
+    }
+    for name, remote_url in remote_urls.items():
+        (tmp_path/name).mkdir()
+        git("init", cwd=tmp_path/name)
+        git("remote", "add", "origin", remote_url, cwd=tmp_path/name)
+    config = HMSSConfig(
+        royal_repos=[str(tmp_path/name) for name in remote_urls],
+        clone_method="ssh",
+        git_host="example.com"
+    )
+    with (
+        patch(
+            "source.royal_repos_backup.PATH_TO_LOG", str(tmp_path/"hm_git.log")
+        ),
+        patch(
+            "source.royal_repos_backup.SSHSession",
+            partial(SSHSession, ssh_command=str(fake_ssh))
+        ),
+        patch("source.royal_repos_backup.subprocess") as subprocess_mock,
+        patch.dict("os.environ") as environ
+    ):
+        environ.pop("GIT_SSH_COMMAND", None)
+        subprocess_mock.run.return_value = \
+            subprocess.CompletedProcess([], 0, stdout="head\n")
+        backup_obj = RoyalReposBackup(config=config, incremental=False)
+        assert backup_obj.back_up_all()
+        assert backup_obj.git_env is None
+        assert not backup_obj.ssh_paths
+    envs = {name: [] for name in remote_urls}
+    for call in subprocess_mock.run.call_args_list:
+        envs[Path(call.kwargs["cwd"]).name].append(call.kwargs["env"])
+    assert len(envs["near"]) == 3
+    assert all(
+        "ControlMaster=no" in env["GIT_SSH_COMMAND"] for env in envs["near"]
+    )
+    assert envs["far"] == [None, None, None]
+    calls = (tmp_path/"ssh_calls").read_text().splitlines()
+    assert "-M -N -f" in calls[0]
+    assert "-O exit" in calls[1]
+    close_log_pipelines()
+    assert "between 2 Git commands" in (tmp_path/"hm_git.log").read_text()
+
+def test_no_ssh_connection_without_due_repos(tmp_path):
+    """ Test that no connection is opened if every repo is fresh. """
+    config = HMSSConfig(
+        royal_repos=["repo"],
+        clone_method="ssh",
+        git_host="example.com",
+        backup_min_interval=3600
+    )
+    state = BackupState()
+    state.record("repo", None)
+    state.write()
+    with (
+        patch(
+            "source.royal_repos_backup.PATH_TO_LOG", str(tmp_path/"hm_git.log")
+        ),
+        patch("source.royal_repos_backup.SSHSession") as session_mock,
+        patch.dict("os.environ") as environ
+    ):
+        environ.pop("GIT_SSH_COMMAND", None)
+        assert RoyalReposBackup(config=config).back_up_all()
+    session_mock.assert_not_called()
@@ -0,0 +1,73 @@
+"""Tests for the shared SSH connection."""
+
+from unittest.mock import patch
+
+from source.ssh_session import (
+    SSHSession,
+    get_ssh_destination,
+    uses_destination,
+)
+
+
+def make_fake_ssh(tmp_path, exit_code=0):
+    """Make a stand-in for SSH which records its arguments."""
+    fake_ssh = tmp_path/"fake_ssh"
+    fake_ssh.write_text(
+        f'#!/bin/sh\necho "$@" >> {tmp_path/"ssh_calls"}\nexit {exit_code}\n',
+        encoding="utf-8",
+    )
+    fake_ssh.chmod(0o755)
+    return str(fake_ssh)
+
+
+def test_session_lifecycle(tmp_path):
+    """The master opens once, is shared, counts its uses and closes."""
+    with SSHSession("git@host", ssh_command=make_fake_ssh(tmp_path)) as session:
+        assert session.active
+        assert session.handshake_time is not None
+        env = session.get_git_env()
+        assert "ControlMaster=no" in env["GIT_SSH_COMMAND"]
+        assert session._get_control_path() in env["GIT_SSH_COMMAND"]
+        for command in ("fetch", "rev-parse HEAD", "ls-remote origin main"):
+            session.note(command)
+        assert session.uses == 2
+        assert "between 2 Git commands" in session.describe()
+    assert not session.active
+    calls = (tmp_path/"ssh_calls").read_text().splitlines()
+    assert len(calls) == 2
+    assert calls[0].endswith("-M -N -f -o ControlPersist=yes git@host")
+    assert calls[1].endswith("-O exit git@host")
+
+
+def test_failed_session_falls_back(tmp_path):
+    """If the master won't open, Git connects as it always did."""
+    session = SSHSession("git@host", ssh_command=make_fake_ssh(tmp_path, 255))
+    with session:
+        assert not session.active
+        assert session.get_git_env() is None
+        session.note("fetch")
+        assert session.uses == 0
+        assert session.describe().startswith("No shared SSH connection")
+    assert len((tmp_path/"ssh_calls").read_text().splitlines()) == 1
+    assert not SSHSession("git@host", ssh_command="/no/such/ssh").start()
+
+
+def test_get_ssh_destination():
+    """Only SSH users who haven't configured Git's SSH get a session."""
+    with patch.dict("os.environ") as environ:
+        environ.pop("GIT_SSH_COMMAND", None)
+        assert get_ssh_destination("ssh", "github.com") == "git@github.com"
+        assert get_ssh_destination("https", "github.com") is None
+        assert get_ssh_destination("ssh", None) is None
+        environ["GIT_SSH_COMMAND"] = "ssh -i key"
+        assert get_ssh_destination("ssh", "github.com") is None
+
+def test_uses_destination():
+    """Only remotes on the destination may share its connection."""
+    destination = "git@github.com"
+    assert uses_destination("git@github.com:tom/repo.git", destination)
+    assert uses_destination("ssh://git@github.com/tom/repo.git", destination)
+    assert not uses_destination("git@gitlab.com:tom/repo.git", destination)
+    assert not uses_destination("git@github.company:repo.git", destination)
+    assert not uses_destination("https://github.com/tom/repo.git", destination)
+    assert not uses_destination(None, destination)
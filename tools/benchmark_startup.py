@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Measure how long each console entry point takes to import."""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+IMPORTTIME_PREFIX = "import time:"
+# What each entry point imports before it does any work.
+ENTRY_POINT_IMPORTS = {
+    "back-up-royal-repos": "import source.cli, source.backup_daemon",
+    "build-wheelhouse": "import source.cli, source.install_dependencies",
+    "install-hmss": (
+        "import source.cli, source.fleet, source.hm_software_installer"
+    ),
+    "schedule-back-up-royal-repos": "import source.cli",
+}
+# Modules which the backup, which runs at every login, must never load.
+BACKUP_FORBIDDEN_MODULES = (
+    "packaging",
+    "source.ci_cache",
+    "source.continuous_integration",
+    "source.fleet",
+    "source.hm_software_installer",
+    "source.install_dependencies",
+    "source.install_steps",
+    "termcolor",
+)
+# Modules which merely pinging the backup daemon must not load either.
+PING_FORBIDDEN_MODULES = (
+    *BACKUP_FORBIDDEN_MODULES,
+    "source.repo_discovery",
+    "source.royal_repos_backup",
+    "source.ssh_session",
+)
+
+
+def measure_imports(statement: str) -> tuple[int, dict[str, int]]:
+    """Run a statement in a fresh interpreter under `-X importtime`.
+
+    Return the total import time in microseconds, and each imported module's
+    cumulative import time.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT,
+    )
+    total, modules = 0, {}
+    for line in completed.stderr.splitlines():
+        fields = line.removeprefix(IMPORTTIME_PREFIX).split("|")
+        if not line.startswith(IMPORTTIME_PREFIX) or \
+                not fields[1].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        modules[name] = int(fields[1])
+        if not fields[2].startswith("  "):  # A top-level import.
+            total += int(fields[1])
+    return total, modules
+
+
+def benchmark(entry_point: str, repeat: int) -> tuple[int, dict[str, int]]:
+    """Return the median total import time of an entry point, and the
+    per-module times from the slowest run."""
+    runs = [
+        measure_imports(ENTRY_POINT_IMPORTS[entry_point])
+        for _ in range(max(repeat, 1))
+    ]
+    totals = [total for total, _ in runs]
+    return int(statistics.median(totals)), max(runs, key=lambda run: run[0])[1]
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Print the import time of each entry point, failing over budget."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "entry_points",
+        nargs="*",
+        help="which entry points to measure (default: all)",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=0,
+        metavar="N",
+        help="also list the N slowest modules for each entry point",
+    )
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        help="exit non-zero if any entry point's median exceeds this",
+    )
+    arguments = parser.parse_args(argv)
+    unknown = set(arguments.entry_points)-set(ENTRY_POINT_IMPORTS)
+    if unknown:
+        parser.error(f"unknown entry points: {', '.join(sorted(unknown))}")
+    result = 0
+    for entry_point in arguments.entry_points or ENTRY_POINT_IMPORTS:
+        median, modules = benchmark(entry_point, arguments.repeat)
+        print(f"{entry_point}: {median/1000:.1f} ms")
+        slowest = sorted(modules.items(), key=lambda item: -item[1])
+        for name, cumulative in slowest[:arguments.top]:
+            print(f"    {cumulative/1000:8.1f} ms  {name}")
+        if arguments.budget_ms and median/1000 > arguments.budget_ms:
+            result = 1
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(main())